@@ -0,0 +1,108 @@
+import time
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+
+def drape_hash(drape: np.ndarray, size: int = 8) -> int:
+    """Average hash of a drape mask: one bit per cell of a size x size grid."""
+    if drape is None:
+        return 0
+    cells = cv2.resize(
+        drape.astype(np.float32), (size, size), interpolation=cv2.INTER_AREA
+    )
+    bits = (cells > 0.5).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def scene_signature(detections: dict, drape: np.ndarray, grid: int = 16) -> tuple:
+    """
+    What the agents' answer depends on: each tool's box quantized to a
+    `grid` x `grid` layout of the frame, and a hash of where the drape is.
+    """
+    h, w = drape.shape[:2] if drape is not None else (1, 1)
+    boxes = []
+    for tool in sorted(detections):
+        x1, y1, x2, y2 = detections[tool]["box"]
+        boxes.append(
+            (
+                tool,
+                int(x1 / w * grid),
+                int(y1 / h * grid),
+                int(x2 / w * grid),
+                int(y2 / h * grid),
+            )
+        )
+    return tuple(boxes), drape_hash(drape)
+
+
+def similar(a: tuple, b: tuple, box_slack: int, hash_distance: int) -> bool:
+    boxes_a, hash_a = a
+    boxes_b, hash_b = b
+    if len(boxes_a) != len(boxes_b):
+        return False
+    for box_a, box_b in zip(boxes_a, boxes_b):
+        # Same tools, each within a grid cell of where it was
+        if box_a[0] != box_b[0]:
+            return False
+        if any(abs(p - q) > box_slack for p, q in zip(box_a[1:], box_b[1:])):
+            return False
+    return (hash_a ^ hash_b).bit_count() <= hash_distance
+
+
+class AgentCache:
+    """
+    Answers of the scene-context agents by scene signature, so a scene the
+    agents were already asked about is not sent again. A lookup matches any
+    entry whose signature is within `box_slack` grid cells per box and
+    `hash_distance` bits of drape hash; entries expire after `ttl` seconds
+    and the least recently used go first past `max_entries`.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 120.0,
+        max_entries: int = 256,
+        box_slack: int = 1,
+        hash_distance: int = 4,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.box_slack = box_slack
+        self.hash_distance = hash_distance
+        self.entries: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, signature: tuple, now: float = None):
+        now = time.monotonic() if now is None else now
+        # Exact matches are the common case on a still scene
+        candidates = [signature] if signature in self.entries else []
+        candidates += [key for key in reversed(self.entries) if key != signature]
+        for key in candidates:
+            stored, context = self.entries[key]
+            if now - stored > self.ttl:
+                continue
+            if key == signature or similar(
+                key, signature, self.box_slack, self.hash_distance
+            ):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return context
+        self.misses += 1
+        return None
+
+    def store(self, signature: tuple, context: dict, now: float = None):
+        now = time.monotonic() if now is None else now
+        self.entries[signature] = (now, context)
+        self.entries.move_to_end(signature)
+        # Expired entries are dropped along with the overflow
+        for key in [
+            k for k, (stored, _) in self.entries.items() if now - stored > self.ttl
+        ]:
+            del self.entries[key]
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
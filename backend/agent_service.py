@@ -0,0 +1,220 @@
+import json
+import asyncio
+
+
+def create_agents(providers: list[str]) -> list:
+    # Imported on demand: each provider SDK is slow to import and optional
+    agents = []
+    for provider in providers:
+        if provider == "gemini":
+            from gemini_agent import GeminiAgent
+
+            agents.append(GeminiAgent())
+        elif provider == "openai":
+            from openai_agent import OpenAIAgent
+
+            agents.append(OpenAIAgent())
+        else:
+            raise ValueError(f"Unknown agent provider {provider!r}")
+    return agents
+
+
+class ContextStream:
+    """
+    Picks the per-image answers out of a batch answer while it streams in.
+    Every JSON object is parsed as soon as its closing brace arrives, so an
+    image's answer is out before the model has written the next one, whether
+    it comes as a list, one object per line or inside a code fence.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.opened = []
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, chunk: str) -> list[tuple[int, dict]]:
+        """(image, {tool: status}) for each answer completed by `chunk`."""
+        answers = []
+        start = len(self.text)
+        self.text += chunk
+        for i in range(start, len(self.text)):
+            c = self.text[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif c == "\\":
+                    self.escaped = True
+                elif c == '"':
+                    self.in_string = False
+            elif c == '"':
+                self.in_string = True
+            elif c == "{":
+                self.opened.append(i)
+            elif c == "}" and self.opened:
+                answer = parse_answer(self.text[self.opened.pop() : i + 1])
+                if answer is not None:
+                    answers.append(answer)
+        return answers
+
+
+def parse_answer(text: str):
+    try:
+        item = json.loads(text)
+        image = item["image"]
+        context = {entry["tool"]: entry["status"] for entry in item["context"]}
+    except (ValueError, TypeError, KeyError):
+        # A tool entry or anything else that is not a whole image answer
+        return None
+    return (image, context) if isinstance(image, int) else None
+
+
+class AgentService:
+    """
+    Long-lived front for the scene-context agents, with one client per
+    provider for the life of the server. Requests from every source that
+    arrive within `batch_window` seconds go out together as one multi-image
+    prompt of at most `max_batch` frames, and each source gets its own
+    answer back as soon as the model has written it. At most `concurrency`
+    batches are in flight. A batch that has not answered after `hedge_after`
+    seconds, or that fails, is raced by another attempt on the next
+    provider; answers count from whichever attempt gives them first.
+    """
+
+    def __init__(
+        self,
+        agents: list,
+        concurrency: int = 2,
+        timeout: float = 20.0,
+        hedge_after: float = 6.0,
+        attempts: int = 2,
+        max_batch: int = 4,
+        batch_window: float = 0.2,
+    ):
+        if not agents:
+            raise ValueError("AgentService needs at least one agent")
+        self.agents = agents
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.attempts = attempts
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.pending: list[tuple[bytes, asyncio.Future]] = []
+        self.wake = asyncio.Event()
+        self.dispatcher = None
+        self.batches: set[asyncio.Task] = set()
+        self.requests = 0
+        self.images = 0
+        self.hedged = 0
+        self.failed = 0
+
+    @property
+    def busy(self) -> bool:
+        # A full batch is already waiting for a free slot
+        return len(self.pending) >= self.max_batch
+
+    async def get_context(self, jpeg: bytes) -> dict:
+        if self.dispatcher is None:
+            self.dispatcher = asyncio.create_task(self.dispatch())
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((jpeg, future))
+        self.wake.set()
+        return await future
+
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self.pending:
+                self.wake.clear()
+                await self.wake.wait()
+            # Give the other sources' ticks a moment to join the batch
+            deadline = loop.time() + self.batch_window
+            while len(self.pending) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self.wake.clear()
+                try:
+                    await asyncio.wait_for(self.wake.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            await self.semaphore.acquire()
+            batch = [
+                (jpeg, future)
+                for jpeg, future in self.pending[: self.max_batch]
+                if not future.done()
+            ]
+            del self.pending[: self.max_batch]
+            if not batch:
+                self.semaphore.release()
+                continue
+            task = asyncio.create_task(self.run_batch(batch))
+            self.batches.add(task)
+            task.add_done_callback(self.batches.discard)
+
+    async def run_batch(self, batch: list[tuple[bytes, asyncio.Future]]):
+        self.requests += 1
+        self.images += len(batch)
+        try:
+            await asyncio.wait_for(self._hedged(batch), self.timeout)
+        except Exception as e:
+            self.failed += 1
+            error = e
+        else:
+            error = None
+        finally:
+            self.semaphore.release()
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error or ValueError("No answer for the image"))
+
+    async def _attempt(self, agent, batch: list[tuple[bytes, asyncio.Future]]):
+        stream = ContextStream()
+        async for chunk in agent.stream([jpeg for jpeg, _ in batch], self.timeout):
+            for image, context in stream.feed(chunk):
+                if 0 <= image < len(batch) and not batch[image][1].done():
+                    batch[image][1].set_result(context)
+            if all(future.done() for _, future in batch):
+                return
+        raise ValueError(f"{agent.name} left images of the batch unanswered")
+
+    async def _hedged(self, batch: list[tuple[bytes, asyncio.Future]]):
+        pending = set()
+        error = None
+        try:
+            for attempt in range(self.attempts):
+                if attempt:
+                    self.hedged += 1
+                agent = self.agents[attempt % len(self.agents)]
+                pending.add(asyncio.create_task(self._attempt(agent, batch)))
+                # The last attempt waits as long as the overall timeout allows
+                wait = self.hedge_after if attempt < self.attempts - 1 else None
+                done, pending = await asyncio.wait(
+                    pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return
+                    error = task.exception()
+            # Every attempt is out; take whichever in-flight one finishes first
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def close(self):
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+        for task in self.batches:
+            task.cancel()
+        for agent in self.agents:
+            await agent.close()
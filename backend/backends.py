@@ -0,0 +1,49 @@
+import os
+from ultralytics import YOLO
+
+# Exported models live next to the checkpoint, named the way ultralytics
+# names its export output (best.pt -> best.onnx, best_openvino_model/, ...)
+BACKENDS = {
+    "torch": "{stem}.pt",
+    "onnx": "{stem}.onnx",
+    "openvino": "{stem}_openvino_model",
+    "openvino-int8": "{stem}_int8_openvino_model",
+}
+
+
+class ModelBackend:
+    """
+    A YOLO segmentation model on one inference runtime. Every backend is
+    called like the PyTorch model and returns ultralytics Results, so the
+    rest of the server does not care which runtime produced them.
+    """
+
+    def __init__(self, name: str, path: str, imgsz):
+        self.name = name
+        self.path = path
+        self.imgsz = imgsz
+        # ultralytics picks ONNX Runtime or OpenVINO from the exported path
+        self.model = YOLO(path, task="segment")
+
+    def __call__(self, images, **kwargs):
+        return self.model(images, imgsz=self.imgsz, **kwargs)
+
+    def __repr__(self):
+        return f"ModelBackend({self.name!r}, {self.path!r}, imgsz={self.imgsz})"
+
+
+def exported_path(weights: str, backend: str) -> str:
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected {list(BACKENDS)}")
+    stem, _ = os.path.splitext(weights)
+    return BACKENDS[backend].format(stem=stem)
+
+
+def load_backend(backend: str, weights: str, imgsz=(480, 640)) -> ModelBackend:
+    path = exported_path(weights, backend)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"{path} not found, export it with: python export_model.py {weights} "
+            f"--backends {backend}"
+        )
+    return ModelBackend(backend, path, list(imgsz))
@@ -0,0 +1,73 @@
+import time
+import argparse
+from collections import Counter
+import cv2
+import numpy as np
+from backends import BACKENDS, load_backend
+
+
+def read_frames(video: str, count: int, size=(640, 480)):
+    cap = cv2.VideoCapture(video)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, size))
+    cap.release()
+    return frames
+
+
+def run_backend(model, frames, conf, warmup=3):
+    for frame in frames[:warmup]:
+        model(frame, verbose=False, conf=conf)
+    latencies, outputs = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        result = model(frame, verbose=False, conf=conf)
+        latencies.append(time.perf_counter() - start)
+        outputs.append(result[0].boxes.data.cpu().numpy())
+    return np.array(latencies) * 1000, outputs
+
+
+def agreement(reference, outputs):
+    """Share of frames whose detected class counts match the reference."""
+    same = [
+        Counter(a[:, 5].astype(int)) == Counter(b[:, 5].astype(int))
+        for a, b in zip(reference, outputs)
+    ]
+    return float(np.mean(same)) if same else 0.0
+
+
+def main(weights, backends, video, count, conf, imgsz):
+    frames = read_frames(video, count)
+    if not frames:
+        raise SystemExit(f"Could not read frames from {video}")
+    print(f"Comparing {backends} on {len(frames)} frames of {video}")
+
+    reference = None
+    for backend in backends:
+        model = load_backend(backend, weights, imgsz)
+        ms, outputs = run_backend(model, frames, conf)
+        if reference is None:
+            reference = outputs
+        print(
+            f"{backend:>14}: mean {ms.mean():.1f}ms p50 {np.percentile(ms, 50):.1f}ms"
+            f" p95 {np.percentile(ms, 95):.1f}ms"
+            f" | {np.mean([len(o) for o in outputs]):.2f} boxes/frame"
+            f" | agreement with {backends[0]} {agreement(reference, outputs):.0%}"
+        )
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser()
+    args.add_argument("video", type=str, help="Recorded video to replay")
+    args.add_argument("--weights", type=str, default="./best.pt")
+    args.add_argument(
+        "--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS)
+    )
+    args.add_argument("--frames", type=int, default=100, help="Frames to run")
+    args.add_argument("--conf", type=float, default=0.4)
+    args.add_argument("--imgsz", nargs=2, type=int, default=[480, 640])
+    args = args.parse_args()
+    main(args.weights, args.backends, args.video, args.frames, args.conf, args.imgsz)
@@ -0,0 +1,120 @@
+import argparse
+import timeit
+from collections import defaultdict
+import numpy as np
+import torch
+from window import WindowAggregator, find_best_result
+
+
+class FakeBoxes:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.boxes = FakeBoxes(data)
+
+
+def reference_find_best_result(results):
+    # The original per-element implementation, kept to check the selection
+    total_results = len(results)
+    class_counters = defaultdict(int)
+
+    for result_obj in results:
+        result_obj = result_obj[0]
+        result_classes = set()
+        boxes_data = result_obj.boxes.data
+        for detection in boxes_data:
+            confidence = detection[4]
+            cls = int(detection[5])
+            if confidence > 0.5 and cls not in result_classes:
+                class_counters[cls] += 1
+                result_classes.add(cls)
+
+    required_classes = [
+        cls for cls, count in class_counters.items() if count > total_results / 2
+    ]
+
+    best_result = None
+    highest_total_confidence = 0
+    frame_idx = None
+
+    for i, result_obj in enumerate(results):
+        detected_classes = set()
+        confidences_per_class = defaultdict(float)
+        boxes_data = result_obj[0].boxes.data
+        for detection in boxes_data:
+            confidence = detection[4]
+            cls = int(detection[5])
+            if cls in required_classes and confidence > 0.5:
+                detected_classes.add(cls)
+                confidences_per_class[cls] += confidence
+
+        if set(required_classes).issubset(detected_classes):
+            total_confidence = sum(confidences_per_class.values())
+            if total_confidence > highest_total_confidence:
+                highest_total_confidence = total_confidence
+                best_result = result_obj
+                frame_idx = i
+
+    return frame_idx, best_result
+
+
+def make_window(rng, num_frames, max_detections, num_classes=3):
+    results = []
+    for _ in range(num_frames):
+        n = rng.integers(0, max_detections + 1)
+        xy = rng.uniform(0, 480, size=(n, 2))
+        wh = rng.uniform(10, 160, size=(n, 2))
+        conf = rng.uniform(0.3, 1.0, size=(n, 1))
+        cls = rng.integers(0, num_classes, size=(n, 1))
+        data = np.hstack([xy, xy + wh, conf, cls]).astype(np.float32)
+        results.append([FakeResult(torch.from_numpy(data))])
+    return results
+
+
+def main(num_frames, max_detections, trials, repeat):
+    rng = np.random.default_rng(0)
+    windows = [make_window(rng, num_frames, max_detections) for _ in range(trials)]
+
+    for results in windows:
+        expected_idx, _ = reference_find_best_result(results)
+        actual_idx, _ = find_best_result(results)
+        assert expected_idx == actual_idx, (expected_idx, actual_idx)
+
+        aggregator = WindowAggregator(num_classes=3)
+        for i, result in enumerate(results):
+            aggregator.add(i, result)
+        best = aggregator.best_result()
+        incremental_idx = None if best is None else best.frame_id
+        assert expected_idx == incremental_idx, (expected_idx, incremental_idx)
+    print(f"Selections match on {trials} windows of {num_frames} frames")
+
+    window = windows[0]
+    reference = min(
+        timeit.repeat(
+            lambda: reference_find_best_result(window), number=1, repeat=repeat
+        )
+    )
+    vectorized = min(
+        timeit.repeat(lambda: find_best_result(window), number=1, repeat=repeat)
+    )
+    aggregator = WindowAggregator(num_classes=3)
+    for i, result in enumerate(window):
+        aggregator.add(i, result)
+    incremental = min(timeit.repeat(aggregator.best_result, number=1, repeat=repeat))
+    print(f"Reference:  {reference * 1000:.2f} ms")
+    print(f"Vectorized: {vectorized * 1000:.2f} ms")
+    print(f"Speedup:    {reference / vectorized:.1f}x")
+    print(f"Incremental tick: {incremental * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser()
+    args.add_argument("--frames", type=int, default=150, help="Frames per window")
+    args.add_argument("--detections", type=int, default=6, help="Max boxes per frame")
+    args.add_argument("--trials", type=int, default=200, help="Windows to compare")
+    args.add_argument("--repeat", type=int, default=20, help="Timing repetitions")
+    args = args.parse_args()
+    main(args.frames, args.detections, args.trials, args.repeat)
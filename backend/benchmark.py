@@ -0,0 +1,381 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+from dataclasses import asdict
+import cv2
+import numpy as np
+from backends import BACKENDS, load_backend
+from config import Config
+from engine import Engine, class_names
+from pipeline import StageStats
+
+
+class PacedCapture:
+    """
+    Delivers frames no faster than `fps`, the way a camera does, so the
+    drop-oldest queues behave as they would live. fps 0 reads flat out.
+    """
+
+    def __init__(self, fps: float):
+        self.frame_interval = 1 / fps if fps else 0
+        self.next_frame = None
+
+    def pace(self):
+        if not self.frame_interval:
+            return
+        now = time.perf_counter()
+        if self.next_frame is not None and now < self.next_frame:
+            time.sleep(self.next_frame - now)
+            now = self.next_frame
+        self.next_frame = now + self.frame_interval
+
+
+class SyntheticCapture(PacedCapture):
+    """
+    Stands in for cv2.VideoCapture with a green drape and a few grey
+    instruments drifting across it, so the pipeline can run without video.
+    """
+
+    def __init__(self, frames: int, fps: float = 30, size=(640, 480), tools=3):
+        super().__init__(fps)
+        self.frames = frames
+        self.size = size
+        self.read_count = 0
+        rng = np.random.default_rng(0)
+        w, h = size
+        self.limit = np.array((w - 120, h - 40))
+        self.positions = rng.uniform((0, 0), self.limit, (tools, 2))
+        self.velocities = rng.uniform(-4, 4, (tools, 2))
+        self.background = np.zeros((h, w, 3), np.uint8)
+        self.background[:] = (90, 160, 40)
+
+    def isOpened(self):
+        return self.read_count < self.frames
+
+    def read(self):
+        if not self.isOpened():
+            return False, None
+        self.pace()
+        frame = self.background.copy()
+        self.positions += self.velocities
+        # Bounce off the edges so tools stay in view
+        out = (self.positions < 0) | (self.positions > self.limit)
+        self.velocities[out] *= -1
+        for i, (x, y) in enumerate(self.positions.astype(int)):
+            shade = 150 + 40 * i
+            cv2.rectangle(frame, (x, y), (x + 120, y + 40), (shade,) * 3, -1)
+        self.read_count += 1
+        return True, frame
+
+    def release(self):
+        self.read_count = self.frames
+
+
+class ReplayCapture(PacedCapture):
+    """A recorded video paced at its own frame rate, optionally cut short."""
+
+    def __init__(self, path: str, frames: int = None, fps: float = None):
+        self.cap = cv2.VideoCapture(path)
+        if fps is None:
+            fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        super().__init__(fps)
+        self.frames = frames
+        self.read_count = 0
+
+    def isOpened(self):
+        if self.frames is not None and self.read_count >= self.frames:
+            return False
+        return self.cap.isOpened()
+
+    def read(self):
+        self.pace()
+        self.read_count += 1
+        return self.cap.read()
+
+    def release(self):
+        self.cap.release()
+
+
+class LocalStorage:
+    """Writes archived clips under a local directory instead of Firebase."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.uploads = 0
+        self.bytes = 0
+
+    def upload(self, video_bytes: bytes, destination_path: str):
+        path = os.path.join(self.directory, destination_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(video_bytes)
+        self.uploads += 1
+        self.bytes += len(video_bytes)
+
+
+class StubAgent:
+    """
+    A local stand-in for a scene-context model. It streams one answer line
+    per image, every tool in place, taking `latency` seconds for the first
+    and `per_image` more for each of the rest, and counts what it is sent.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency: float = 2.0, per_image: float = 0.2):
+        self.latency = latency
+        self.per_image = per_image
+        self.calls = 0
+        self.images = 0
+
+    async def stream(self, jpegs: list[bytes], timeout: float = 60):
+        self.calls += 1
+        self.images += len(jpegs)
+        context = [
+            {"tool": tool, "status": "in place"} for tool in class_names.values()
+        ]
+        await asyncio.sleep(self.latency)
+        for i in range(len(jpegs)):
+            if i:
+                await asyncio.sleep(self.per_image)
+            yield json.dumps({"image": i, "context": context}) + "\n"
+
+    async def close(self):
+        pass
+
+
+class BenchClient:
+    """
+    A WebSocket stand-in that counts what a client would receive, optionally
+    taking as long to send as a link of `bandwidth` bytes per second would.
+    """
+
+    def __init__(self, index: int, bandwidth: float = None):
+        self.remote_address = ("bench", index)
+        self.bandwidth = bandwidth
+        self.messages = 0
+        self.bytes = 0
+
+    async def send(self, message):
+        if isinstance(message, str):
+            message = message.encode()
+        # Binary messages arrive as header and payload fragments
+        size = sum(map(len, message)) if isinstance(message, tuple) else len(message)
+        if self.bandwidth:
+            await asyncio.sleep(size / self.bandwidth)
+        self.messages += 1
+        self.bytes += size
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(
+    engine: Engine, clients: int, binary: bool, slow: int, bandwidth: float
+):
+    # Loads and warms the model, keeping that out of the numbers
+    await engine.start()
+    bench_clients = [
+        BenchClient(i, bandwidth if i >= clients - slow else None)
+        for i in range(clients)
+    ]
+    subscribers = [engine.connect(0, client, binary) for client in bench_clients]
+    start = time.perf_counter()
+    # Subscribers return once the source runs out of frames
+    await asyncio.gather(*(s.run() for s in subscribers))
+    await engine.tasks[0]
+    elapsed = time.perf_counter() - start
+    # Let the last clips finish archiving before reading the counters
+    if engine.uploader.queue is not None:
+        await engine.uploader.queue.join()
+    return elapsed, bench_clients, subscribers
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="surgical-bench-")
+    config = Config(
+        model_weights=args.weights,
+        model_backend=args.backend,
+        model_imgsz=tuple(args.imgsz),
+        interval=args.interval,
+        small_interval=args.small_interval,
+        segment_dir=os.path.join(workdir, "segments"),
+        replay_dir=os.path.join(workdir, "replay"),
+        sightings_db=os.path.join(workdir, "sightings.db"),
+        max_batch=args.max_batch,
+        motion_threshold=args.motion_threshold,
+    )
+    if args.video:
+        cap = ReplayCapture(args.video, args.frames, args.fps)
+        source = args.video
+    else:
+        fps = 30 if args.fps is None else args.fps
+        cap = SyntheticCapture(args.frames or 300, fps)
+        source = "synthetic"
+
+    def load_model():
+        return load_backend(
+            config.model_backend, config.model_weights, config.model_imgsz
+        )
+
+    # Keep every sample so percentiles cover the whole run
+    stats = StageStats(window=10**6)
+    storage = LocalStorage(os.path.join(workdir, "storage"))
+    agent = agents = None
+    if args.agent_latency is not None:
+        from agent_service import AgentService
+
+        agent = StubAgent(args.agent_latency)
+        agents = AgentService([agent], timeout=args.agent_latency + 5)
+    engine = Engine(
+        config, load_model, [lambda: cap], storage.upload, stats, agents=agents
+    )
+
+    try:
+        elapsed, clients, subscribers = asyncio.run(
+            run_benchmark(
+                engine, args.clients, args.binary, args.slow_clients, args.bandwidth
+            )
+        )
+    finally:
+        engine.scheduler.close()
+        engine.sighting_index.close()
+        engine.ring.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    stages = stats.summary()
+    frames = stages.get("end_to_end", {}).get("count", 0)
+    gate = engine.sources[0].gate
+    results = {
+        "commit": git_commit(),
+        "time": time.time(),
+        "source": source,
+        "clients": args.clients,
+        "binary": args.binary,
+        "config": asdict(config),
+        "elapsed_s": elapsed,
+        "frames": frames,
+        "fps": frames / elapsed if elapsed else 0.0,
+        "startup": engine.startup,
+        "stages": stages,
+        "peak_rss_mb": peak_rss_mb(),
+        "average_batch": engine.scheduler.average_batch,
+        "inference": {"inferred": gate.inferred, "skipped": gate.skipped},
+        "dropped_frames": engine.sources[0].dropped,
+        "per_client": [
+            {
+                "messages": c.messages,
+                "bytes": c.bytes,
+                "bytes_per_frame": c.bytes / frames if frames else 0.0,
+                "dropped": s.dropped,
+                "bandwidth": c.bandwidth,
+                "quality_level": s.level,
+            }
+            for c, s in zip(clients, subscribers)
+        ],
+        "agent": (
+            {
+                "calls": agent.calls,
+                "images": agent.images,
+                "cache_hits": engine.agent_cache.hits,
+                "cache_misses": engine.agent_cache.misses,
+            }
+            if agent
+            else None
+        ),
+        "clips": {
+            "archived": storage.uploads,
+            "bytes": storage.bytes,
+            "dropped": engine.uploader.dropped,
+            "failed": engine.uploader.failed,
+        },
+    }
+
+    print(f"{frames} frames from {source} in {elapsed:.1f}s: {results['fps']:.1f} FPS")
+    for stage, s in stages.items():
+        print(
+            f"{stage:>16}: p50 {s['p50_ms']:.1f}ms p95 {s['p95_ms']:.1f}ms"
+            f" p99 {s['p99_ms']:.1f}ms (n={s['count']})"
+        )
+    print(f"Peak RSS: {results['peak_rss_mb']:.0f} MB")
+    for i, client in enumerate(results["per_client"]):
+        print(
+            f"Client {i}: {client['bytes'] / 1024**2:.1f} MB in"
+            f" {client['messages']} messages, {client['dropped']} dropped,"
+            f" quality level {client['quality_level']}"
+        )
+    if agent:
+        print(
+            f"Agent calls: {agent.calls}, cache hits {engine.agent_cache.hits}"
+            f" of {engine.agent_cache.hits + engine.agent_cache.misses} lookups"
+        )
+    print(f"Clips archived: {storage.uploads} ({storage.bytes / 1024**2:.1f} MB)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser()
+    args.add_argument(
+        "video", type=str, nargs="?", help="Recorded video (default: synthetic)"
+    )
+    args.add_argument("--frames", type=int, default=None, help="Frames to run")
+    args.add_argument(
+        "--fps",
+        type=float,
+        default=None,
+        help="Capture rate (default: the video's own, 30 synthetic; 0 unpaced)",
+    )
+    args.add_argument("--weights", type=str, default="./best.pt")
+    args.add_argument("--backend", choices=list(BACKENDS), default="torch")
+    args.add_argument("--imgsz", nargs=2, type=int, default=[480, 640])
+    args.add_argument("--clients", type=int, default=1)
+    args.add_argument("--binary", action="store_true", help="Binary frame protocol")
+    args.add_argument(
+        "--slow-clients", type=int, default=0, help="Clients on a limited link"
+    )
+    args.add_argument(
+        "--bandwidth",
+        type=float,
+        default=250_000,
+        help="Bytes per second of the slow clients' link (default: 250000)",
+    )
+    args.add_argument("--interval", type=float, default=5)
+    args.add_argument("--small-interval", type=float, default=4)
+    args.add_argument("--max-batch", type=int, default=4)
+    args.add_argument("--motion-threshold", type=float, default=4.0)
+    args.add_argument(
+        "--agent-latency",
+        type=float,
+        default=None,
+        help="Consult a local stub agent answering after this many seconds",
+    )
+    args.add_argument(
+        "--output", type=str, default="benchmark.json", help="Results file"
+    )
+    main(args.parse_args())
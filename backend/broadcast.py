@@ -0,0 +1,187 @@
+import time
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+import websockets
+from protocol import FRAME, Message
+
+
+@dataclass(frozen=True)
+class Quality:
+    scale: float
+    jpeg_quality: int
+    max_fps: float
+
+
+# From what a client on a good link gets down to what still shows the
+# tools on congested hospital Wi-Fi
+QUALITY_LEVELS = (
+    Quality(1.0, 95, 30),
+    Quality(1.0, 75, 15),
+    Quality(0.75, 60, 10),
+    Quality(0.5, 50, 5),
+)
+
+
+class RateController:
+    """
+    Moves one client along the quality ladder. A send that takes more than
+    half the client's frame interval, or frames backing up in its outbox,
+    steps it down at once; a clean `upgrade_after` seconds steps it back up.
+    """
+
+    def __init__(
+        self, levels=QUALITY_LEVELS, hold: float = 1.0, upgrade_after: float = 5.0
+    ):
+        self.levels = levels
+        self.hold = hold
+        self.upgrade_after = upgrade_after
+        self.level = 0
+        self.changed = 0.0
+        self.last_congested = 0.0
+
+    @property
+    def quality(self) -> Quality:
+        return self.levels[self.level]
+
+    def update(self, send_seconds: float, backlog: int, now: float) -> int:
+        budget = 1 / self.quality.max_fps
+        if send_seconds > budget / 2 or backlog > 1:
+            self.congested(now)
+        elif (
+            self.level > 0
+            and now - self.last_congested >= self.upgrade_after
+            and now - self.changed >= self.upgrade_after
+        ):
+            self.level -= 1
+            self.changed = now
+        return self.level
+
+    def congested(self, now: float):
+        self.last_congested = now
+        # Give the previous step time to show before stepping again
+        if self.level < len(self.levels) - 1 and now - self.changed >= self.hold:
+            self.level += 1
+            self.changed = now
+
+
+class Subscriber:
+    """
+    A connected client with its own outbox. Status and control messages go
+    first and are never dropped; frames wait in a bounded queue that loses
+    its oldest frame when the client falls behind, and are sent at the
+    quality the client's rate controller has settled on.
+    """
+
+    def __init__(
+        self, ws: websockets.WebSocketServerProtocol, queue_size: int, binary: bool
+    ):
+        self.ws = ws
+        self.binary = binary
+        self.queue_size = queue_size
+        self.frames = deque()
+        self.urgent = deque()
+        self.wake = asyncio.Event()
+        self.rate = RateController()
+        self.last_frame = 0.0
+        self.dropped = 0
+        self.sent = 0
+        self.bytes_sent = 0
+        # Seconds the last message waited in the outbox and on the socket
+        self.send_lag = 0.0
+
+    @property
+    def level(self) -> int:
+        return self.rate.level
+
+    @property
+    def pending(self) -> int:
+        return len(self.frames) + len(self.urgent)
+
+    def wants_frame(self, timestamp: float) -> bool:
+        # Slightly early is fine, so a 15 fps client keeps every other frame
+        interval = 1 / self.rate.quality.max_fps
+        return timestamp - self.last_frame >= interval * 0.9
+
+    def publish(self, message: Message):
+        now = time.perf_counter()
+        if message is None or message.kind != FRAME:
+            self.urgent.append((now, message))
+        else:
+            # A slow client loses its oldest pending frame instead of
+            # holding back the camera or the other clients
+            if len(self.frames) >= self.queue_size:
+                self.frames.popleft()
+                self.dropped += 1
+                self.rate.congested(now)
+            self.frames.append((now, message))
+            self.last_frame = message.timestamp
+        self.wake.set()
+
+    async def run(self):
+        while True:
+            if not self.urgent and not self.frames:
+                self.wake.clear()
+                await self.wake.wait()
+                continue
+            published, message = (self.urgent or self.frames).popleft()
+            if message is None:
+                return
+            data = message.binary if self.binary else message.text
+            start = time.perf_counter()
+            await self.ws.send(data)
+            now = time.perf_counter()
+            self.send_lag = now - published
+            self.sent += 1
+            self.bytes_sent += (
+                sum(len(part) for part in data) if self.binary else len(data)
+            )
+            if message.kind == FRAME:
+                self.rate.update(now - start, len(self.frames), now)
+
+
+class Broadcaster:
+    def __init__(self, queue_size: int = 4):
+        self.queue_size = queue_size
+        self.connected_clients: set[Subscriber] = set()
+
+    def subscribe(
+        self, ws: websockets.WebSocketServerProtocol, binary: bool = False
+    ) -> Subscriber:
+        subscriber = Subscriber(ws, self.queue_size, binary)
+        self.connected_clients.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.connected_clients.discard(subscriber)
+
+    def wanted_qualities(self, timestamp: float) -> dict[int, Quality]:
+        """Quality levels some client is due a frame at, so only those are encoded."""
+        return {
+            s.level: s.rate.quality
+            for s in self.connected_clients
+            if s.wants_frame(timestamp)
+        }
+
+    def publish_frame(self, frame_id: int, timestamp: float, encoded: dict):
+        messages = {
+            level: Message(FRAME, frame_id, timestamp, payload)
+            for level, payload in encoded.items()
+        }
+        for subscriber in self.connected_clients:
+            # A client whose level changed while encoding picks up the next frame
+            message = messages.get(subscriber.level)
+            if message is not None and subscriber.wants_frame(timestamp):
+                subscriber.publish(message)
+
+    def publish(self, message: Message):
+        for subscriber in self.connected_clients:
+            subscriber.publish(message)
+
+    def close(self):
+        # Tell every subscriber the stream has ended
+        self.publish(None)
+
+    @property
+    def dropped(self):
+        return {str(s.ws.remote_address): s.dropped for s in self.connected_clients}
@@ -0,0 +1,108 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+from pipeline import StageStats
+
+
+@dataclass
+class ClipJob:
+    source_id: int
+    path: str
+    local_path: str
+    tools: set = field(default_factory=set)
+
+
+class ClipUploader:
+    """
+    Archives finished clips to remote storage on a small thread pool so the
+    live loop never waits on Firebase.
+    """
+
+    def __init__(
+        self,
+        upload: Callable[[bytes, str], None],
+        on_uploaded: Callable[[ClipJob], None],
+        stats: StageStats,
+        workers: int = 2,
+        queue_size: int = 4,
+        retries: int = 3,
+        backoff: float = 1.0,
+        submit_timeout: float = 0.5,
+    ):
+        self.upload = upload
+        self.on_uploaded = on_uploaded
+        self.stats = stats
+        self.num_workers = workers
+        self.queue_size = queue_size
+        self.retries = retries
+        self.backoff = backoff
+        self.submit_timeout = submit_timeout
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="clip")
+        self.queue: asyncio.Queue = None
+        self.workers: list[asyncio.Task] = []
+        self.dropped = 0
+        self.failed = 0
+        self.uploaded = 0
+
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.num_workers)
+        ]
+
+    async def submit(self, job: ClipJob) -> bool:
+        if not self.workers:
+            self.start()
+        # Wait briefly for room, then give up on the clip rather than
+        # stalling the live stream behind a slow uplink
+        try:
+            await asyncio.wait_for(self.queue.put(job), self.submit_timeout)
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            print(f"Upload queue full, dropped clip {job.path}")
+            return False
+        return True
+
+    @property
+    def pending(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                self.failed += 1
+                print(f"Failed to upload clip {job.path}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _process(self, job: ClipJob):
+        with self.stats.timer("clip_read"):
+            video_bytes = await self._run(read_file, job.local_path)
+
+        for attempt in range(self.retries + 1):
+            try:
+                with self.stats.timer("clip_upload"):
+                    await self._run(self.upload, video_bytes, job.path)
+                break
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2**attempt
+                print(f"Upload of {job.path} failed ({e}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+
+        self.uploaded += 1
+        self.on_uploaded(job)
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
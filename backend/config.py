@@ -0,0 +1,125 @@
+import os
+import json
+import argparse
+import tempfile
+from dataclasses import dataclass, field, fields, replace
+
+
+@dataclass
+class Config:
+    """Everything the engine and server need to know, with the lab defaults."""
+
+    # Inference runtime: one of backends.BACKENDS, exported with export_model.py
+    model_weights: str = "./best.pt"
+    model_backend: str = "torch"
+    model_imgsz: tuple = (480, 640)
+    # Camera indices or stream URLs, opened when a client first asks for one
+    sources: list = field(default_factory=lambda: [0])
+
+    host: str = "localhost"
+    port: int = 8080
+    # Serve /profile, a sampling profile of every thread on request
+    profiler: bool = False
+    # Print stage latencies and drop counters on every status tick
+    verbose: bool = False
+
+    interval: float = 5
+    small_interval: float = 4
+    confidence: float = 0.4
+    # Drape colour range, and the fraction of a tool's mask that must lie on
+    # the drape for it to be in place
+    lower_hsv: tuple = (64, 70, 51)
+    upper_hsv: tuple = (102, 255, 255)
+    placement_overlap: float = 0.9
+
+    # Clips are streamed to disk at a constant frame rate while recording
+    clip_fps: int = 15
+    segment_dir: str = os.path.join(tempfile.gettempdir(), "surgical-segments")
+    # Recent segments are kept locally and served for replay
+    replay_dir: str = os.path.join(tempfile.gettempdir(), "surgical-replay")
+    replay_retention: float = 600
+    replay_max_bytes: int = 2 * 1024**3
+    sightings_db: str = "sightings.db"
+
+    # Frames from all sources are batched together, waiting at most
+    # max_batch_latency seconds for a batch to fill
+    max_batch: int = 4
+    max_batch_latency: float = 0.01
+    # Inference only runs on frames that changed, at min_fps to max_fps
+    motion_threshold: float = 4.0
+    min_fps: float = 2
+    max_fps: float = 30
+
+    # Scene-context agents ("gemini", "openai") asked about each tick's frame
+    # beside the live loop; none by default
+    agent_providers: list = field(default_factory=list)
+    agent_concurrency: int = 2
+    agent_timeout: float = 20
+    agent_hedge_after: float = 6
+    # Frames from all sources asked about within agent_batch_window seconds
+    # share one prompt of up to agent_max_batch images
+    agent_max_batch: int = 4
+    agent_batch_window: float = 0.2
+    # Answers are reused while the tools and drape stay where they were
+    agent_cache_ttl: float = 120
+    agent_cache_size: int = 256
+
+    # Clips are archived to this bucket; credentials are only read on the
+    # first upload
+    firebase_credentials: str = (
+        "calhacks2024-c1a62-firebase-adminsdk-9obo0-63385ce9b4.json"
+    )
+    storage_bucket: str = "calhacks2024-c1a62.appspot.com"
+    database_url: str = "calhacks2024-c1a62-default-rtdb.firebaseio.com/"
+
+    @classmethod
+    def load(cls, path: str) -> "Config":
+        with open(path) as f:
+            values = json.load(f)
+        known = {f.name for f in fields(cls)}
+        unknown = set(values) - known
+        if unknown:
+            raise ValueError(f"Unknown config keys in {path}: {sorted(unknown)}")
+        return cls(**values)
+
+
+def source_spec(value: str):
+    # Camera indices are ints to OpenCV, anything else is a path or URL
+    return int(value) if value.isdigit() else value
+
+
+def parse_args(argv=None) -> Config:
+    """A Config from an optional JSON file, with command line overrides."""
+    parser = argparse.ArgumentParser(description="Surgical tool tracking server")
+    parser.add_argument("--config", type=str, help="JSON file of Config fields")
+    parser.add_argument("--host", type=str)
+    parser.add_argument("--port", type=int)
+    parser.add_argument(
+        "--sources", nargs="+", type=source_spec, help="Camera indices or URLs"
+    )
+    parser.add_argument("--weights", dest="model_weights", type=str)
+    parser.add_argument("--backend", dest="model_backend", type=str)
+    parser.add_argument("--confidence", type=float)
+    parser.add_argument("--interval", type=float)
+    parser.add_argument("--small-interval", type=float)
+    parser.add_argument(
+        "--profiler", action="store_const", const=True, help="Serve /profile"
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_const",
+        const=True,
+        help="Print stage latencies and drops on every tick",
+    )
+    parser.add_argument(
+        "--agents",
+        dest="agent_providers",
+        nargs="+",
+        choices=["gemini", "openai"],
+        help="Scene-context agents to consult on each tick",
+    )
+    args = vars(parser.parse_args(argv))
+
+    path = args.pop("config")
+    config = Config.load(path) if path else Config()
+    return replace(config, **{k: v for k, v in args.items() if v is not None})
@@ -1,22 +1,206 @@
+import os
+import base64
+import hashlib
 import argparse
-from firebase_admin import credentials, initialize_app, storage
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from firebase_storage import FirebaseStorage
 
 
-def main(source_path: str, output_path: str = None):
-    cred = credentials.Certificate(
-        "calhacks2024-c1a62-firebase-adminsdk-9obo0-63385ce9b4.json"
+class LocalBlob:
+    """The parts of a storage blob the downloader uses, for a local file."""
+
+    def __init__(self, root: str, name: str):
+        self.name = name
+        self.path = os.path.join(root, name)
+        self.size = os.path.getsize(self.path)
+        with open(self.path, "rb") as f:
+            self.md5_hash = base64.b64encode(hashlib.md5(f.read()).digest()).decode()
+
+    def download_as_bytes(self, start: int = None, end: int = None) -> bytes:
+        # `end` is inclusive, as in a range request
+        with open(self.path, "rb") as f:
+            f.seek(start or 0)
+            if end is None:
+                return f.read()
+            return f.read(end + 1 - (start or 0))
+
+
+class LocalBucket:
+    """
+    A directory standing in for the clip bucket, such as one the benchmark
+    archived to, so bulk downloads can run without Firebase.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def list_blobs(self, prefix: str = ""):
+        for directory, _, files in os.walk(self.root):
+            for file in sorted(files):
+                name = os.path.relpath(os.path.join(directory, file), self.root)
+                name = name.replace(os.sep, "/")
+                if name.startswith(prefix):
+                    yield LocalBlob(self.root, name)
+
+    def get_blob(self, name: str):
+        if not os.path.isfile(os.path.join(self.root, name)):
+            return None
+        return LocalBlob(self.root, name)
+
+
+def clip_time(name: str):
+    """Capture time of an archived clip, which is named by its timestamp."""
+    try:
+        return float(os.path.splitext(os.path.basename(name))[0])
+    except ValueError:
+        return None
+
+
+def file_md5(path: str) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            md5.update(block)
+    return base64.b64encode(md5.digest()).decode()
+
+
+class BulkDownloader:
+    """
+    Downloads many clips from one bucket client on a bounded thread pool.
+    Each clip is fetched in `chunk_size` range requests into a .part file,
+    so an interrupted run picks up where it stopped, and is only moved into
+    place once its MD5 matches the bucket's. Clips already present and
+    intact are skipped.
+    """
+
+    def __init__(
+        self, bucket, output_dir: str, workers: int = 8, chunk_size: int = 8 << 20
+    ):
+        self.bucket = bucket
+        self.output_dir = output_dir
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+    def select(
+        self, prefix: str = "", since: float = None, until: float = None
+    ) -> list:
+        blobs = []
+        for blob in self.bucket.list_blobs(prefix=prefix):
+            if since is not None or until is not None:
+                timestamp = clip_time(blob.name)
+                if timestamp is None:
+                    continue
+                if since is not None and timestamp < since:
+                    continue
+                if until is not None and timestamp > until:
+                    continue
+            blobs.append(blob)
+        return blobs
+
+    def download_all(self, blobs: list) -> dict:
+        results = {"downloaded": 0, "skipped": 0, "failed": 0}
+        with ThreadPoolExecutor(self.workers) as pool:
+            for blob, outcome in zip(blobs, pool.map(self.try_download, blobs)):
+                results[outcome] += 1
+                if outcome != "skipped":
+                    print(f"{outcome}: {blob.name}")
+        return results
+
+    def try_download(self, blob) -> str:
+        try:
+            return self.download(blob)
+        except Exception as e:
+            print(f"Failed to download {blob.name}: {e!r}")
+            return "failed"
+
+    def download(self, blob, output_path: str = None) -> str:
+        if output_path is None:
+            output_path = os.path.join(self.output_dir, blob.name)
+        if (
+            os.path.exists(output_path)
+            and os.path.getsize(output_path) == blob.size
+            and self.verified(output_path, blob)
+        ):
+            return "skipped"
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+        partial = output_path + ".part"
+        offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+        if offset > blob.size:
+            offset = 0
+        with open(partial, "ab" if offset else "wb") as f:
+            while offset < blob.size:
+                end = min(offset + self.chunk_size, blob.size) - 1
+                data = blob.download_as_bytes(start=offset, end=end)
+                if not data:
+                    raise IOError(f"Empty range at {offset} of {blob.name}")
+                f.write(data)
+                offset += len(data)
+
+        if not self.verified(partial, blob):
+            # A corrupt partial would fail every resume, so start over next run
+            os.remove(partial)
+            raise IOError(f"Checksum mismatch for {blob.name}")
+        os.replace(partial, output_path)
+        return "downloaded"
+
+    @staticmethod
+    def verified(path: str, blob) -> bool:
+        # Composite objects carry no MD5; their size was already checked
+        return blob.md5_hash is None or file_md5(path) == blob.md5_hash
+
+
+def read_manifest(path: str) -> list[str]:
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and line[0] != "#"]
+
+
+def main(args):
+    config = Config.load(args.config) if args.config else Config()
+    if args.local:
+        bucket = LocalBucket(args.local)
+    else:
+        # One authenticated client for every download
+        bucket = FirebaseStorage(
+            config.firebase_credentials, config.storage_bucket, config.database_url
+        ).get_bucket()
+    downloader = BulkDownloader(
+        bucket, args.output_dir, args.workers, args.chunk_size << 20
+    )
+
+    if args.path:
+        blob = bucket.get_blob(args.path)
+        if blob is None:
+            raise SystemExit(f"{args.path} not found")
+        output_path = args.output or args.path
+        print(f"{downloader.download(blob, output_path)}: {args.path}")
+        return
+
+    if args.manifest:
+        blobs = []
+        for name in read_manifest(args.manifest):
+            blob = bucket.get_blob(name)
+            if blob is None:
+                print(f"Not found: {name}")
+            else:
+                blobs.append(blob)
+    else:
+        blobs = downloader.select(args.prefix, args.since, args.until)
+    results = downloader.download_all(blobs)
+    print(
+        f"{len(blobs)} clips: {results['downloaded']} downloaded,"
+        f" {results['skipped']} already present, {results['failed']} failed"
     )
-    initialize_app(cred, {"storageBucket": "calhacks2024-c1a62.appspot.com"})
-    bucket = storage.bucket()
-    blob = bucket.blob(source_path)
-    if output_path is None:
-        output_path = source_path
-    blob.download_to_filename(output_path)
+    if results["failed"]:
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
     args = argparse.ArgumentParser()
-    args.add_argument("path", type=str, help="Path of the file in Firebase")
+    args.add_argument(
+        "path", type=str, nargs="?", help="Path of a single file in Firebase"
+    )
     args.add_argument(
         "-o",
         "--output",
@@ -24,5 +208,27 @@ if __name__ == "__main__":
         default=None,
         help="Path to the output file (default: same as input)",
     )
-    args = args.parse_args()
-    main(args.path, args.output)
+    args.add_argument(
+        "--prefix", type=str, default="", help="Download every clip under a prefix"
+    )
+    args.add_argument(
+        "--since", type=float, default=None, help="Only clips captured from this time"
+    )
+    args.add_argument(
+        "--until", type=float, default=None, help="Only clips captured up to this time"
+    )
+    args.add_argument(
+        "--manifest", type=str, default=None, help="File listing one clip per line"
+    )
+    args.add_argument(
+        "--output-dir", type=str, default=".", help="Where bulk downloads are written"
+    )
+    args.add_argument("--workers", type=int, default=8, help="Concurrent downloads")
+    args.add_argument(
+        "--chunk-size", type=int, default=8, help="Range request size in MB"
+    )
+    args.add_argument(
+        "--local", type=str, default=None, help="Download from a directory instead"
+    )
+    args.add_argument("--config", type=str, default=None, help="JSON config file")
+    main(args.parse_args())
@@ -0,0 +1,480 @@
+import os
+import json
+import time
+import asyncio
+from typing import Callable
+import cv2
+import numpy as np
+from config import Config
+from pipeline import InferenceScheduler, Source, StageStats
+from motion import MotionGate
+from broadcast import Broadcaster, Subscriber
+from window import Detections, WindowAggregator
+from placement import (
+    DrapeMask,
+    classify_placement,
+    masks_to_numpy,
+    overlap_fractions,
+)
+from tracker import IoUTracker
+from overlay import OverlayRenderer
+from clip_worker import ClipJob, ClipUploader
+from segment_writer import Segment, SegmentWriter
+from recorder import SegmentRing
+from sightings import SightingIndex
+from protocol import STATUS, Message
+from status import StatusLog, encode
+from agent_cache import AgentCache, scene_signature
+
+class_names = {0: "forceps", 1: "gauze", 2: "scissors"}
+tool_ids = {tool: cls for cls, tool in class_names.items()}
+colors = [(255, 42, 4), (235, 219, 11), (243, 243, 243)]
+
+
+class Engine:
+    """
+    Capture, inference, status and recording for every source, with the
+    model loader, the capture openers and the clip storage passed in so the
+    same loop runs against live cameras, recorded video or a local stand-in
+    for Firebase. Nothing heavy happens until start() loads the model.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        load_model: Callable[[], object],
+        open_captures: list[Callable[[], object]],
+        upload: Callable[[bytes, str], None],
+        stats: StageStats = None,
+        started: float = None,
+        agents=None,
+    ):
+        self.config = config
+        self.load_model = load_model
+        # Optional AgentService asked for a second opinion on each tick
+        self.agents = agents
+        # One question in flight per source; the service batches across them
+        self.agent_tasks: dict[int, asyncio.Task] = {}
+        self.agent_cache = AgentCache(config.agent_cache_ttl, config.agent_cache_size)
+        self.stats = stats or StageStats()
+        # Startup milestones in seconds since `started` (process start)
+        self.started = started or time.perf_counter()
+        self.startup: dict[str, float] = {}
+        self.ready = asyncio.Event()
+        self.scheduler = InferenceScheduler(
+            None,
+            config.confidence,
+            self.stats,
+            config.max_batch,
+            config.max_batch_latency,
+        )
+        self.sources = [
+            Source(
+                i,
+                open_capture,
+                self.stats,
+                MotionGate(config.motion_threshold, config.min_fps, config.max_fps),
+            )
+            for i, open_capture in enumerate(open_captures)
+        ]
+        lower_hsv = np.array(config.lower_hsv)
+        upper_hsv = np.array(config.upper_hsv)
+        tools = class_names.values()
+        self.last_seen = [{tool: "" for tool in tools} for _ in self.sources]
+        self.broadcasters = [Broadcaster() for _ in self.sources]
+        self.drape_masks = [DrapeMask(lower_hsv, upper_hsv) for _ in self.sources]
+        self.status_logs = [StatusLog() for _ in self.sources]
+        for status_log in self.status_logs:
+            status_log.update(
+                [
+                    {
+                        "tool": tool,
+                        "status": "missing",
+                        "last_seen": "",
+                        "count": 0,
+                        "instances": [],
+                    }
+                    for tool in tools
+                ],
+                time.time(),
+            )
+        self.ring = SegmentRing(
+            config.replay_dir, config.replay_retention, config.replay_max_bytes
+        )
+        self.sighting_index = SightingIndex(config.sightings_db)
+        self.uploader = ClipUploader(upload, self.mark_archived, self.stats)
+        # Held so pending submissions are not garbage collected mid-flight
+        self.submissions: set[asyncio.Task] = set()
+        self.tasks: dict[int, asyncio.Task] = {}
+        self.writers: dict[int, SegmentWriter] = {}
+        self.errors = 0
+
+    async def start(self):
+        start = time.perf_counter()
+        model = await asyncio.to_thread(self.load_model)
+        self.startup["model_load_s"] = time.perf_counter() - start
+        start = time.perf_counter()
+        await asyncio.to_thread(self.warmup, model)
+        self.startup["warmup_s"] = time.perf_counter() - start
+        self.scheduler.model = model
+        self.mark("ready_s")
+        self.ready.set()
+
+    def warmup(self, model):
+        # The first calls allocate buffers and pick kernels; pay for that
+        # before a client is waiting, at both ends of the batch range
+        w, h = self.sources[0].size if self.sources else (640, 480)
+        dummy = np.zeros((h, w, 3), np.uint8)
+        for batch in sorted({1, self.config.max_batch}):
+            model([dummy] * batch, verbose=False, conf=self.config.confidence)
+
+    def mark(self, milestone: str):
+        if milestone not in self.startup:
+            self.startup[milestone] = time.perf_counter() - self.started
+            print(f"Startup: {milestone} {self.startup[milestone]:.2f}")
+
+    def connect(
+        self,
+        source_id: int,
+        ws,
+        binary: bool = False,
+        since: int = None,
+        run: str = None,
+    ) -> Subscriber:
+        subscriber = self.broadcasters[source_id].subscribe(ws, binary=binary)
+        self.sync(source_id, subscriber, since, run)
+        # Every client of a source shares one capture and inference loop
+        task = self.tasks.get(source_id)
+        if task is None or task.done() or task.cancelling():
+            self.tasks[source_id] = asyncio.create_task(self.run(source_id))
+        return subscriber
+
+    def sync(
+        self,
+        source_id: int,
+        subscriber: Subscriber,
+        since: int = None,
+        run: str = None,
+    ):
+        """
+        Bring a client's tool state up to date: the events of run `run`
+        after `since` if they are all still kept, otherwise a snapshot.
+        """
+        status_log = self.status_logs[source_id]
+        now = time.time()
+        events = status_log.since(since, run) if since is not None else None
+        if events is None:
+            events = [status_log.snapshot(now)]
+        for event in events:
+            subscriber.publish(Message(STATUS, 0, now, encode(event)))
+
+    def request(self, source_id: int, subscriber: Subscriber, message):
+        # Clients may ask for a fresh snapshot or to resume after a gap
+        try:
+            request = json.loads(message)
+            if request.get("type") == "snapshot":
+                self.sync(source_id, subscriber)
+            elif request.get("type") == "resume":
+                self.sync(
+                    source_id, subscriber, int(request["since"]), request.get("run")
+                )
+        except (ValueError, TypeError, KeyError, AttributeError):
+            print(f"Ignoring client request {message!r}")
+
+    def disconnect(self, source_id: int, subscriber: Subscriber):
+        broadcaster = self.broadcasters[source_id]
+        broadcaster.unsubscribe(subscriber)
+        if not broadcaster.connected_clients:
+            self.tasks[source_id].cancel()
+
+    async def run(self, source_id: int):
+        config = self.config
+        stats = self.stats
+        source = self.sources[source_id]
+        broadcaster = self.broadcasters[source_id]
+        drape_mask = self.drape_masks[source_id]
+        last_seen = self.last_seen[source_id]
+        status_log = self.status_logs[source_id]
+        window = WindowAggregator(len(class_names), keep_masks=True)
+        tracker = IoUTracker(missing_after=config.small_interval)
+        renderer = OverlayRenderer(class_names, colors)
+        loop = asyncio.get_running_loop()
+
+        def record_segment(segment: Segment):
+            # Keep the segment locally for replay, then archive it in the background
+            entry = self.ring.add(segment, segment.context)
+            for tool in entry.tools:
+                last_seen[tool] = entry.name
+            publish_status(
+                0,
+                entry.end_time,
+                [{"tool": tool, "last_seen": entry.name} for tool in entry.tools],
+            )
+            job = ClipJob(source_id, entry.name, entry.local_path, entry.tools)
+            task = asyncio.create_task(self.uploader.submit(job))
+            self.submissions.add(task)
+            task.add_done_callback(self.submissions.discard)
+
+        def submit_segment(segment: Segment):
+            # Called from the writer thread once ffmpeg has finished the file
+            loop.call_soon_threadsafe(record_segment, segment)
+
+        writer = SegmentWriter(
+            os.path.join(config.segment_dir, str(source_id)),
+            submit_segment,
+            config.clip_fps,
+        )
+        self.writers[source_id] = writer
+
+        def publish_status(frame_id: int, timestamp: float, entries: list[dict]):
+            for event in status_log.update(entries, timestamp):
+                broadcaster.publish(Message(STATUS, frame_id, timestamp, encode(event)))
+
+        result = None
+        start_time = time.time()
+        tick_time = start_time
+        # Tools judged in or out of place at any tick of the current segment
+        segment_tools = set()
+        capture_run = self.scheduler.add_source(source)
+        try:
+            async for frame in source.frames():
+                if frame.skip:
+                    # Nothing moved, so the last result still describes the scene
+                    if result is None:
+                        continue
+                    frame_detections = window.add(frame.frame_id, result)
+                    tracker.propagate(frame.timestamp)
+                else:
+                    result = frame.result
+                    frame_detections = window.add(frame.frame_id, result)
+                    tracker.update(frame_detections, frame.timestamp)
+                    # Per-instance status for every tracked tool in this frame
+                    await asyncio.to_thread(
+                        self.check_track_placement,
+                        tracker,
+                        frame_detections,
+                        result,
+                        drape_mask,
+                        frame.timestamp,
+                    )
+
+                # Annotate and encode off the event loop
+                qualities = broadcaster.wanted_qualities(frame.timestamp)
+                annotated_frame, encoded = await asyncio.to_thread(
+                    annotate_frame, renderer, result, stats, frame.image, qualities
+                )
+                writer.write(annotated_frame, frame.timestamp)
+                broadcaster.publish_frame(frame.frame_id, frame.timestamp, encoded)
+                stats.record("end_to_end", time.time() - frame.timestamp)
+                self.mark("first_frame_s")
+
+                # Instance changes go out as soon as a frame shows them
+                publish_status(
+                    frame.frame_id, frame.timestamp, instance_entries(tracker)
+                )
+
+                # Get the current time
+                current_time = time.time()
+
+                if current_time - tick_time >= config.small_interval:
+                    tick_time = current_time
+                    context = {}
+                    detections = {}
+                    best_result = window.best_result()
+                    if best_result:
+                        # Judge placement on the best frame itself
+                        placement = await asyncio.to_thread(
+                            self.check_placement, best_result, drape_mask
+                        )
+                        for cls, (status, i) in placement.items():
+                            x1, y1, x2, y2, conf, _ = best_result.data[i]
+                            context[class_names[cls]] = status
+                            detections[class_names[cls]] = {
+                                "confidence": float(conf),
+                                "box": [float(x1), float(y1), float(x2), float(y2)],
+                            }
+                    segment_tools |= set(context)
+                    if self.agents is not None:
+                        signature = scene_signature(detections, drape_mask.mask)
+                        self.ask_agents(
+                            source_id,
+                            annotated_frame,
+                            signature,
+                            current_time,
+                            publish_status,
+                        )
+
+                    # Tool status is decided over the window, once per tick
+                    publish_status(
+                        frame.frame_id,
+                        current_time,
+                        [
+                            {"tool": tool, "status": context.get(tool, "missing")}
+                            for tool in last_seen
+                        ],
+                    )
+                    self.sighting_index.record(
+                        source_id,
+                        current_time,
+                        [
+                            {"tool": tool, **fields, **detections.get(tool, {})}
+                            for tool, fields in status_log.tools.items()
+                        ],
+                    )
+                    window.reset()
+                    if config.verbose:
+                        # The same numbers are on /metrics; this is for a terminal
+                        gate = source.gate
+                        print(
+                            f"Source {source_id}: {stats.report()}"
+                            f" | batch {self.scheduler.average_batch:.2f}"
+                            f" | dropped {source.dropped}"
+                            f" | skipped {gate.skipped}/{gate.skipped + gate.inferred}"
+                            f" | client drops {broadcaster.dropped}"
+                        )
+
+                if current_time - start_time >= config.interval:
+                    video_path = clip_name(source_id, current_time)
+                    writer.rotate(video_path, segment_tools)
+                    self.sighting_index.assign_segment(
+                        source_id, video_path, start_time, current_time
+                    )
+                    if config.verbose:
+                        print(
+                            f"Source {source_id}: {self.uploader.pending} clip"
+                            f" uploads pending, {writer.dropped} clip frames dropped"
+                        )
+
+                    start_time = current_time
+                    segment_tools = set()
+
+        except Exception as e:
+            self.errors += 1
+            print(f"Engine for source {source_id} failed: {e!r}")
+        finally:
+            await asyncio.to_thread(self.scheduler.remove_source, source, capture_run)
+            await asyncio.to_thread(writer.close)
+        # The source ended on its own, so release the subscribers
+        broadcaster.close()
+
+    def ask_agents(
+        self,
+        source_id: int,
+        image: np.ndarray,
+        signature: tuple,
+        timestamp: float,
+        publish_status,
+    ):
+        def publish(context: dict):
+            publish_status(
+                0,
+                timestamp,
+                [
+                    {"tool": tool, "agent_status": status}
+                    for tool, status in context.items()
+                    if tool in tool_ids
+                ],
+            )
+
+        # A scene the agents already judged is answered from the cache
+        context = self.agent_cache.lookup(signature)
+        if context is not None:
+            publish(context)
+            return
+        asking = self.agent_tasks.get(source_id)
+        if self.agents.busy or (asking is not None and not asking.done()):
+            return
+
+        # Runs beside the live loop; the answer arrives as a status delta
+        async def ask():
+            _, buffer = await asyncio.to_thread(cv2.imencode, ".jpg", image)
+            try:
+                with self.stats.timer("agent"):
+                    context = await self.agents.get_context(buffer.tobytes())
+            except Exception as e:
+                print(f"Agent check failed: {e!r}")
+                return
+            self.agent_cache.store(signature, context)
+            publish(context)
+
+        self.agent_tasks[source_id] = asyncio.create_task(ask())
+
+    def check_placement(self, best_result: Detections, drape_mask: DrapeMask):
+        with self.stats.timer("placement"):
+            drape = drape_mask.get(best_result.image)
+            return classify_placement(
+                best_result,
+                drape,
+                self.config.placement_overlap,
+                self.config.confidence,
+            )
+
+    def check_track_placement(
+        self,
+        tracker: IoUTracker,
+        frame_detections: Detections,
+        result,
+        drape_mask: DrapeMask,
+        timestamp: float,
+    ):
+        with self.stats.timer("track_placement"):
+            tracks = [t for t in tracker.confirmed() if t.detection_index >= 0]
+            if not tracks:
+                return
+            if frame_detections.masks is None:
+                frame_detections.masks = masks_to_numpy(result)
+            drape = drape_mask.get(result[0].orig_img)
+            indices = np.array([t.detection_index for t in tracks])
+            fractions = overlap_fractions(frame_detections, indices, drape)
+            threshold = self.config.placement_overlap
+            for track, fraction in zip(tracks, fractions):
+                status = "in place" if fraction >= threshold else "out of place"
+                tracker.set_status(track, status, timestamp)
+
+    def mark_archived(self, job: ClipJob):
+        entry = self.ring.get(job.path)
+        if entry is not None:
+            entry.archived = True
+
+
+def annotate_frame(
+    renderer: OverlayRenderer, result, stats: StageStats, image, qualities: dict
+):
+    with stats.timer("plot"):
+        annotated_frame = renderer.render(result, image)
+    # One JPEG per quality level some client is due a frame at
+    encoded = {}
+    with stats.timer("encode"):
+        for level, quality in qualities.items():
+            frame = annotated_frame
+            if quality.scale != 1:
+                frame = cv2.resize(
+                    frame,
+                    None,
+                    fx=quality.scale,
+                    fy=quality.scale,
+                    interpolation=cv2.INTER_AREA,
+                )
+            params = [cv2.IMWRITE_JPEG_QUALITY, quality.jpeg_quality]
+            _, buffer = cv2.imencode(".jpg", frame, params)
+            encoded[level] = buffer.data
+    return annotated_frame, encoded
+
+
+def instance_entries(tracker: IoUTracker) -> list[dict]:
+    counts = tracker.counts()
+    tracks = tracker.confirmed()
+    return [
+        {
+            "tool": tool,
+            "count": counts.get(cls, 0),
+            "instances": [t.as_dict() for t in tracks if t.cls == cls],
+        }
+        for cls, tool in class_names.items()
+    ]
+
+
+def clip_name(source_id: int, timestamp: float):
+    if source_id == 0:
+        return f"{timestamp}.mp4"
+    return f"source{source_id}/{timestamp}.mp4"
@@ -0,0 +1,56 @@
+import os
+import shutil
+import argparse
+from ultralytics import YOLO
+from backends import BACKENDS, exported_path
+
+EXPORT_ARGS = {
+    "onnx": {"format": "onnx", "dynamic": True, "simplify": True},
+    "openvino": {"format": "openvino", "dynamic": True},
+    "openvino-int8": {"format": "openvino", "int8": True},
+}
+
+
+def main(weights: str, backends: list[str], imgsz: list[int], data: str = None):
+    for backend in backends:
+        if backend == "torch":
+            continue
+        kwargs = dict(EXPORT_ARGS[backend], imgsz=imgsz)
+        if backend == "openvino-int8":
+            if data is None:
+                raise SystemExit("openvino-int8 needs --data for calibration")
+            kwargs["data"] = data
+        # Load fresh each time: export mutates the model it is called on
+        output = YOLO(weights).export(**kwargs)
+        target = exported_path(weights, backend)
+        if os.path.abspath(output) != os.path.abspath(target):
+            shutil.rmtree(target, ignore_errors=True)
+            shutil.move(output, target)
+        print(f"Exported {backend} to {target}")
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser()
+    args.add_argument("weights", type=str, help="Path of the PyTorch checkpoint")
+    args.add_argument(
+        "--backends",
+        nargs="+",
+        choices=list(BACKENDS),
+        default=["onnx", "openvino"],
+        help="Backends to export (default: onnx openvino)",
+    )
+    args.add_argument(
+        "--imgsz",
+        nargs=2,
+        type=int,
+        default=[480, 640],
+        help="Input height and width (default: 480 640)",
+    )
+    args.add_argument(
+        "--data",
+        type=str,
+        default=None,
+        help="Dataset YAML used to calibrate INT8 models",
+    )
+    args = args.parse_args()
+    main(args.weights, args.backends, args.imgsz, args.data)
@@ -0,0 +1,48 @@
+import uuid
+import threading
+
+
+class FirebaseStorage:
+    """
+    Uploads clips to a Firebase Storage bucket. The admin SDK is imported
+    and initialised on the first upload rather than at server start.
+    """
+
+    def __init__(self, credentials_path: str, bucket: str, database_url: str):
+        self.credentials_path = credentials_path
+        self.bucket_name = bucket
+        self.database_url = database_url
+        self.lock = threading.Lock()
+        self.bucket = None
+
+    def get_bucket(self):
+        # Uploads run on a thread pool, so only one may initialise the app
+        with self.lock:
+            if self.bucket is None:
+                import firebase_admin
+                from firebase_admin import credentials, storage
+
+                cred = credentials.Certificate(self.credentials_path)
+                firebase_admin.initialize_app(
+                    cred,
+                    {
+                        "storageBucket": self.bucket_name,
+                        "databaseURL": self.database_url,
+                    },
+                )
+                self.bucket = storage.bucket()
+            return self.bucket
+
+    def upload(self, video_bytes: bytes, destination_path: str):
+        blob = self.get_bucket().blob(destination_path)
+
+        # Generate a UUID for the download token
+        token = uuid.uuid4()
+
+        # Set the metadata including the download token
+        blob.metadata = {
+            "firebaseStorageDownloadTokens": str(token),
+        }
+
+        # Upload the file with the specified content type
+        blob.upload_from_string(video_bytes, content_type="video/mp4")
@@ -1,10 +1,7 @@
 import os
 import base64
-import json
 import asyncio
 from enum import Enum
-from PIL import Image
-from io import BytesIO
 from dotenv import load_dotenv
 import google.generativeai as genai
 from langchain_core.output_parsers import JsonOutputParser
@@ -12,9 +9,6 @@ from pydantic import BaseModel, Field
 
 load_dotenv()
 
-api_key = os.environ.get("GEMINI_API_KEY")
-genai.configure(api_key=api_key)
-
 
 class Tool(str, Enum):
     scissors = "scissors"
@@ -28,29 +22,20 @@ class ObjectContext(BaseModel, use_enum_values=True):
 
 
 class ImageContext(BaseModel):
+    image: int = Field(description="number of the image, from 0")
     context: list[ObjectContext] = Field(...)
 
 
-output_parser = JsonOutputParser(pydantic_object=ImageContext)
-
-
-def create_model():
-    model = genai.GenerativeModel(
-        "gemini-1.5-flash", generation_config=genai.GenerationConfig(temperature=0)
-    )
-    return model
+class BatchContext(BaseModel):
+    images: list[ImageContext] = Field(...)
 
 
-async def predict_object_context(model: genai.GenerativeModel, image_b64: str):
-    # Decode the base64 image string
-    image_data = base64.b64decode(image_b64)
+output_parser = JsonOutputParser(pydantic_object=BatchContext)
 
-    # Convert the binary data to an image using PIL
-    image_context = Image.open(BytesIO(image_data))
-
-    # Define the prompt with the image and class names
-    prompt = """
-    You are given an image containing segmented (highlighted and labeled) surgical tools.
+# Formatted once; the format instructions never change between calls
+PROMPT = """
+    Each image contains segmented (highlighted and labeled) surgical tools.
+    Judge every image on its own and answer for each one, in order.
     The surgical site is in the center of the image and it is surrounded by a colored cloth.
     If the tool is placed fully within the cloth, then it is in place.
     Else, if the tool is partially on the cloth or in the surgical site, then it is out of place.
@@ -58,32 +43,51 @@ async def predict_object_context(model: genai.GenerativeModel, image_b64: str):
     {output_format}
 
     This is very important to my career.
-    """
+    """.format(output_format=output_parser.get_format_instructions())
+
+
+class GeminiAgent:
+    """One long-lived Gemini model, asked about JPEG frames as they are."""
+
+    name = "gemini"
+
+    def __init__(self, model_name: str = "gemini-1.5-flash", api_key: str = None):
+        genai.configure(api_key=api_key or os.environ.get("GEMINI_API_KEY"))
+        self.model = genai.GenerativeModel(
+            model_name, generation_config=genai.GenerationConfig(temperature=0)
+        )
+
+    async def stream(self, jpegs: list[bytes], timeout: float = 60):
+        """Streams the answer about a batch of JPEG frames as it is generated."""
+        # Inline image data goes straight to the API, no PIL decode
+        parts = []
+        for i, jpeg in enumerate(jpegs):
+            parts += [f"Image {i}:", {"mime_type": "image/jpeg", "data": jpeg}]
+        header = f"You are given {len(jpegs)} images, numbered from 0."
+        response = await self.model.generate_content_async(
+            [*parts, "\n\n", header, PROMPT],
+            stream=True,
+            request_options={"timeout": timeout},
+        )
+        async for chunk in response:
+            yield chunk.text
+
+    async def close(self):
+        pass
 
-    prompt = prompt.format(output_format=output_parser.get_format_instructions())
 
-    # Generate the content using the model
-    result = ""
-    async for chunk in await model.generate_content_async(
-        [image_context, "\n\n", prompt],
-        generation_config={"temperature": 0},
-        stream=True,
-        request_options={"timeout": 60},
-    ):
-        result += chunk.text
-    return result
+def parse_context(text: str) -> dict:
+    result = output_parser.parse(text)
+    return {tool["tool"]: tool["status"] for tool in result["images"][0]["context"]}
 
 
-async def get_context(image_b64: str):
-    model = create_model()
-    result = await predict_object_context(model, image_b64)
-    result = output_parser.parse(result)
-    context = result["context"]
-    return {tool["tool"]: tool["status"] for tool in context}
+async def get_context(jpeg: bytes, agent: GeminiAgent = None):
+    agent = agent or GeminiAgent()
+    return parse_context("".join([chunk async for chunk in agent.stream([jpeg])]))
 
 
 if __name__ == "__main__":
     with open("message.txt", "r") as f:
-        img_b64 = f.read()
-    result = asyncio.run(get_context(img_b64))
+        jpeg = base64.b64decode(f.read())
+    result = asyncio.run(get_context(jpeg))
     print(result)
@@ -0,0 +1,148 @@
+import json
+import re
+from http import HTTPStatus
+from metrics import render_metrics
+from profiler import SamplingProfiler, collapse
+from recorder import SegmentRing
+from sightings import SightingIndex
+
+RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, size: int):
+    match = RANGE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end:
+        return None
+    return start, end
+
+
+def replay_response(ring: SegmentRing, name: str, request_headers):
+    # Runs in a worker thread, since it reads the segment from disk
+    entry = ring.get(name)
+    if entry is None:
+        return HTTPStatus.NOT_FOUND, {}, b"Segment not available locally\n"
+
+    headers = {
+        "Content-Type": "video/mp4",
+        "Accept-Ranges": "bytes",
+        "Access-Control-Allow-Origin": "*",
+    }
+    byte_range = (0, entry.size - 1)
+    status = HTTPStatus.OK
+    if "Range" in request_headers:
+        byte_range = parse_range(request_headers["Range"], entry.size)
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{entry.size}"
+            return HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, headers, b""
+        status = HTTPStatus.PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{entry.size}"
+
+    body = ring.read(entry, *byte_range)
+    if body is None:
+        return HTTPStatus.NOT_FOUND, {}, b"Segment not available locally\n"
+    return status, headers, body
+
+
+def segments_response(ring: SegmentRing, query: dict, now: float):
+    tool = query.get("tool", [None])[0]
+    try:
+        minutes = float(query.get("minutes", ["5"])[0])
+    except ValueError as e:
+        return HTTPStatus.BAD_REQUEST, {}, f"{e}\n".encode("utf-8")
+    entries = ring.between(now - minutes * 60, now, tool)
+    body = json.dumps(
+        [
+            {
+                "name": entry.name,
+                "start_time": entry.start_time,
+                "end_time": entry.end_time,
+                "tools": sorted(entry.tools),
+                "archived": entry.archived,
+            }
+            for entry in entries
+        ]
+    )
+    headers = {
+        "Content-Type": "application/json",
+        "Access-Control-Allow-Origin": "*",
+    }
+    return HTTPStatus.OK, headers, body.encode("utf-8")
+
+
+def sightings_response(index: SightingIndex, query: dict):
+    def param(name, convert=str):
+        values = query.get(name)
+        return convert(values[0]) if values else None
+
+    try:
+        rows = index.query(
+            tool=param("tool"),
+            status=param("status"),
+            start=param("start", float),
+            end=param("end", float),
+            source_id=param("source", int),
+            limit=param("limit", int) or 1000,
+        )
+    except ValueError as e:
+        return HTTPStatus.BAD_REQUEST, {}, f"{e}\n".encode("utf-8")
+    headers = {
+        "Content-Type": "application/json",
+        "Access-Control-Allow-Origin": "*",
+    }
+    return HTTPStatus.OK, headers, json.dumps(rows).encode("utf-8")
+
+
+def metrics_response(engine):
+    headers = {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    return HTTPStatus.OK, headers, render_metrics(engine).encode("utf-8")
+
+
+def profile_response(profiler: SamplingProfiler, query: dict):
+    # Runs in a worker thread for the length of the profile
+    try:
+        seconds = float(query.get("seconds", ["10"])[0])
+    except ValueError as e:
+        return HTTPStatus.BAD_REQUEST, {}, f"{e}\n".encode("utf-8")
+    if not 0 < seconds <= 60:
+        return HTTPStatus.BAD_REQUEST, {}, b"seconds must be between 0 and 60\n"
+    if profiler.busy:
+        return HTTPStatus.CONFLICT, {}, b"A profile is already running\n"
+    stacks = profiler.sample(seconds)
+    headers = {"Content-Type": "text/plain; charset=utf-8"}
+    return HTTPStatus.OK, headers, collapse(stacks).encode("utf-8")
+
+
+def health_response(engine):
+    # 503 until the model is loaded and warm, so orchestrators wait for it
+    ready = engine.ready.is_set()
+    body = json.dumps(
+        {
+            "status": "ready" if ready else "starting",
+            "startup": engine.startup,
+            "sources": [
+                {
+                    "id": source.source_id,
+                    "streaming": source.cap is not None,
+                    "clients": len(
+                        engine.broadcasters[source.source_id].connected_clients
+                    ),
+                }
+                for source in engine.sources
+            ],
+        }
+    )
+    status = HTTPStatus.OK if ready else HTTPStatus.SERVICE_UNAVAILABLE
+    headers = {
+        "Content-Type": "application/json",
+        "Access-Control-Allow-Origin": "*",
+    }
+    return status, headers, body.encode("utf-8")
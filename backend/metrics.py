@@ -0,0 +1,206 @@
+from collections import defaultdict
+
+PREFIX = "surgical_"
+QUANTILES = {"p50": "0.5", "p95": "0.95", "p99": "0.99"}
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Exposition:
+    """Samples grouped by metric, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.families = {}
+        self.samples = defaultdict(list)
+
+    def add(self, name: str, kind: str, help: str, value, suffix="", **labels):
+        name = PREFIX + name
+        self.families.setdefault(name, (kind, help))
+        label_text = ",".join(f'{k}="{escape(v)}"' for k, v in labels.items())
+        if label_text:
+            label_text = "{" + label_text + "}"
+        self.samples[name].append(f"{name}{suffix}{label_text} {float(value):g}")
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help) in self.families.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(self.samples[name])
+        return "\n".join(lines) + "\n"
+
+
+def render_metrics(engine) -> str:
+    """
+    Everything the engine already counts, read on demand so nothing is
+    spent on metrics between scrapes.
+    """
+    out = Exposition()
+
+    summary = engine.stats.summary()
+    for stage, (count, total) in engine.stats.cumulative().items():
+        help = "Stage latency, quantiles over the recent window"
+        for key, q in QUANTILES.items():
+            if stage in summary:
+                seconds = summary[stage][f"{key}_ms"] / 1000
+                out.add(
+                    "stage_seconds", "summary", help, seconds, stage=stage, quantile=q
+                )
+        out.add("stage_seconds", "summary", help, total, "_sum", stage=stage)
+        out.add("stage_seconds", "summary", help, count, "_count", stage=stage)
+
+    scheduler = engine.scheduler
+    out.add("inference_batches_total", "counter", "Model calls", scheduler.batches)
+    out.add(
+        "inference_batched_frames_total",
+        "counter",
+        "Frames sent to the model",
+        scheduler.batched_frames,
+    )
+
+    for source in engine.sources:
+        sid = source.source_id
+        for queue, dropped in source.dropped.items():
+            out.add(
+                "frames_dropped_total",
+                "counter",
+                "Frames dropped by a full pipeline queue",
+                dropped,
+                source=sid,
+                queue=queue,
+            )
+        out.add(
+            "queue_depth",
+            "gauge",
+            "Items waiting in a pipeline queue",
+            len(source.captured),
+            source=sid,
+            queue="captured",
+        )
+        out.add(
+            "queue_depth",
+            "gauge",
+            "Items waiting in a pipeline queue",
+            len(source.inferred),
+            source=sid,
+            queue="inferred",
+        )
+        writer = engine.writers.get(sid)
+        if writer is not None:
+            out.add(
+                "queue_depth",
+                "gauge",
+                "Items waiting in a pipeline queue",
+                writer.queue.qsize(),
+                source=sid,
+                queue="clip_writer",
+            )
+            out.add(
+                "clip_frames_dropped_total",
+                "counter",
+                "Frames the clip writer could not keep up with",
+                writer.dropped,
+                source=sid,
+            )
+        if source.gate is not None:
+            for outcome in ("inferred", "skipped"):
+                out.add(
+                    "motion_gate_frames_total",
+                    "counter",
+                    "Frames the motion gate sent to or kept from the model",
+                    getattr(source.gate, outcome),
+                    source=sid,
+                    outcome=outcome,
+                )
+
+        clients = engine.broadcasters[sid].connected_clients
+        out.add("clients", "gauge", "Connected clients", len(clients), source=sid)
+        for subscriber in clients:
+            client = subscriber.ws.remote_address
+            if isinstance(client, tuple):
+                client = ":".join(map(str, client[:2]))
+            labels = {"source": sid, "client": client}
+            out.add(
+                "client_queue_depth",
+                "gauge",
+                "Messages waiting in a client's outbox",
+                subscriber.pending,
+                **labels,
+            )
+            out.add(
+                "client_quality_level",
+                "gauge",
+                "Stream quality step of a client, 0 is full quality",
+                subscriber.level,
+                **labels,
+            )
+            out.add(
+                "client_send_lag_seconds",
+                "gauge",
+                "Time the last message spent between publish and sent",
+                subscriber.send_lag,
+                **labels,
+            )
+            out.add(
+                "client_messages_sent_total",
+                "counter",
+                "Messages sent to a client",
+                subscriber.sent,
+                **labels,
+            )
+            out.add(
+                "client_bytes_sent_total",
+                "counter",
+                "Bytes sent to a client",
+                subscriber.bytes_sent,
+                **labels,
+            )
+            out.add(
+                "client_messages_dropped_total",
+                "counter",
+                "Messages dropped for a slow client",
+                subscriber.dropped,
+                **labels,
+            )
+
+    uploader = engine.uploader
+    out.add(
+        "clip_uploads_pending", "gauge", "Clips waiting to upload", uploader.pending
+    )
+    for outcome in ("uploaded", "dropped", "failed"):
+        out.add(
+            "clip_uploads_total",
+            "counter",
+            "Clip uploads by outcome",
+            getattr(uploader, outcome),
+            outcome=outcome,
+        )
+    out.add(
+        "replay_bytes", "gauge", "Bytes held for local replay", engine.ring.total_bytes
+    )
+    out.add("engine_errors_total", "counter", "Engine loop failures", engine.errors)
+    if engine.agents is not None:
+        cache = engine.agent_cache
+        for outcome in ("hits", "misses"):
+            out.add(
+                "agent_cache_lookups_total",
+                "counter",
+                "Agent answer cache lookups by outcome",
+                getattr(cache, outcome),
+                outcome=outcome,
+            )
+        out.add(
+            "agent_requests_total",
+            "counter",
+            "Batched requests sent to the scene-context agents",
+            engine.agents.requests,
+        )
+        out.add(
+            "agent_images_total",
+            "counter",
+            "Frames sent to the scene-context agents",
+            engine.agents.images,
+        )
+    return out.render()
@@ -0,0 +1,70 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Decides per frame whether to run full inference. A frame is compared to
+    the last inferred one on a downscaled grayscale grid, and the score is
+    the largest mean change of any cell, so a hand reaching for one tool is
+    not averaged away by a still table. Inference always runs at least
+    `min_fps` times a second and never more than `max_fps`.
+
+    The reference only moves once a frame actually reaches the model (see
+    accept), so a chosen frame that is dropped on the way does not hide the
+    motion it was chosen for.
+    """
+
+    def __init__(
+        self, threshold=4.0, min_fps=2.0, max_fps=30.0, thumb=(64, 48), grid=(4, 4)
+    ):
+        self.threshold = threshold
+        self.min_interval = 1 / min_fps
+        self.max_interval = 1 / max_fps
+        self.thumb_size = thumb
+        self.grid = grid
+        self.reference = None
+        self.last_inference = None
+        self.skipped = 0
+        self.inferred = 0
+
+    def reset(self):
+        self.reference = None
+        self.last_inference = None
+
+    def score(self, thumb: np.ndarray) -> float:
+        rows, cols = self.grid
+        h, w = thumb.shape
+        diff = np.abs(thumb - self.reference)
+        cells = diff[: h - h % rows, : w - w % cols].reshape(
+            rows, h // rows, cols, w // cols
+        )
+        return float(cells.mean(axis=(1, 3)).max())
+
+    def thumbnail(self, image: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        thumb = cv2.resize(gray, self.thumb_size, interpolation=cv2.INTER_AREA)
+        return thumb.astype(np.float32)
+
+    def should_infer(self, thumb: np.ndarray, timestamp: float) -> bool:
+        if self.last_inference is None:
+            run = True
+        else:
+            elapsed = timestamp - self.last_inference
+            if elapsed < self.max_interval:
+                run = False
+            elif elapsed >= self.min_interval or self.reference is None:
+                run = True
+            else:
+                run = self.score(thumb) > self.threshold
+
+        if run:
+            self.last_inference = timestamp
+            self.inferred += 1
+        else:
+            self.skipped += 1
+        return run
+
+    def accept(self, thumb: np.ndarray):
+        """Called with the thumbnail of each frame the model is given."""
+        self.reference = thumb
@@ -1,4 +1,5 @@
 import os
+import base64
 import asyncio
 from enum import Enum
 from dotenv import load_dotenv
@@ -8,26 +9,30 @@ from pydantic import BaseModel, Field
 
 load_dotenv()
 
+
 class Tool(str, Enum):
     scissors = "scissors"
     forceps = "forceps"
     gauze = "gauze"
 
+
 class ObjectContext(BaseModel, use_enum_values=True):
     tool: Tool = Field(...)
     status: str = Field(description="in place, out of place, or missing")
 
 
 class ImageContext(BaseModel):
+    image: int = Field(description="number of the image, from 0")
     context: list[ObjectContext]
 
-def create_client():
-    return AsyncOpenAI(
-        api_key=os.environ.get("OPENAI_API_KEY"),
-    )
 
-output_parser = JsonOutputParser(pydantic_object=ImageContext)
-prompt = """You are given an image containing segmented (highlighted and labeled) surgical tools.
+class BatchContext(BaseModel):
+    images: list[ImageContext]
+
+
+output_parser = JsonOutputParser(pydantic_object=BatchContext)
+prompt = """Each image contains segmented (highlighted and labeled) surgical tools.
+    Judge every image on its own and answer for each one, in order.
     The surgical site is in the center of the image and it is surrounded by a blue colored cloth.
 
     Use the image content and segmentation to determine the color and position of the cloth and the objects. 
@@ -40,46 +45,65 @@ prompt = """You are given an image containing segmented (highlighted and labeled
 prompt = prompt.format(output_format=output_parser.get_format_instructions())
 
 
-async def get_response(client, b64_image, class_names):
-    # Format the class names into a human-readable list format
-    class_list = ', '.join(class_names)
+class OpenAIAgent:
+    """
+    One AsyncOpenAI client, and with it one connection pool, shared by every
+    request. Retries are left to the caller, which can hedge them.
+    """
+
+    name = "openai"
+
+    def __init__(self, model: str = "gpt-4-turbo", api_key: str = None):
+        self.model = model
+        self.client = AsyncOpenAI(
+            api_key=api_key or os.environ.get("OPENAI_API_KEY"), max_retries=0
+        )
 
-    return await client.chat.completions.create(
-        model="gpt-4-turbo",
-        temperature=0,
-        response_format={ "type": "json_object" },
-        messages=[
+    async def stream(self, jpegs: list[bytes], timeout: float = 60):
+        """Streams the answer about a batch of JPEG frames as it is generated."""
+        content = [
             {
-            "role": "user",
-            "content": [
-                {
                 "type": "text",
-                "text": prompt,
-                },
-                {
-                "type": "image_url",
-                "image_url": {
-                    "url":  f"data:image/jpeg;base64,{b64_image}"
-                },
-                },
-            ],
+                "text": f"You are given {len(jpegs)} images, numbered from 0.\n"
+                + prompt,
             }
-        ],
-    )
+        ]
+        for jpeg in jpegs:
+            # The API only takes images as data URLs
+            url = "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("ascii")
+            content.append({"type": "image_url", "image_url": {"url": url}})
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            temperature=0,
+            response_format={"type": "json_object"},
+            timeout=timeout,
+            stream=True,
+            messages=[{"role": "user", "content": content}],
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def close(self):
+        await self.client.close()
+
+
+async def get_context(jpeg: bytes, agent: OpenAIAgent = None):
+    agent = agent or OpenAIAgent()
+    return "".join([chunk async for chunk in agent.stream([jpeg])])
 
-async def get_context(b64_image, class_names):
-    client = create_client()
-    response = await get_response(client, b64_image, class_names)
-    return response.choices[0].message.content
-    # parser = JsonOutputParser()
-    # return parser.parse(response["choices"][0]["message"]["content"][0]["text"])
 
 async def main():
-    test_image = "replace"
-    class_names = ['forceps', 'gauze', 'scissors']
-    res = await get_context(test_image, class_names)
+    with open("frame.jpg", "rb") as f:
+        jpeg = f.read()
+    agent = OpenAIAgent()
+    try:
+        res = await get_context(jpeg, agent)
+    finally:
+        await agent.close()
     print(output_parser.parse(res))
     print(res)
 
 
-asyncio.run(main())
\ No newline at end of file
+if __name__ == "__main__":
+    asyncio.run(main())
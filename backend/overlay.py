@@ -0,0 +1,81 @@
+import cv2
+import numpy as np
+
+
+def label_map(masks: np.ndarray) -> np.ndarray:
+    """(n, h, w) instance masks to an (h, w) map of 1-based instance ids."""
+    n = len(masks)
+    dtype = np.uint8 if n < 256 else np.uint16
+    ids = np.arange(1, n + 1, dtype=dtype)[:, None, None]
+    # Where instances overlap the later one wins, as when drawn in order
+    return (masks * ids).max(axis=0)
+
+
+def unletterbox(labels: np.ndarray, shape) -> np.ndarray:
+    """Crop the letterbox padding off a model-sized map and resize to `shape`."""
+    mh, mw = labels.shape
+    h, w = shape[:2]
+    gain = min(mh / h, mw / w)
+    pad_x, pad_y = (mw - w * gain) / 2, (mh - h * gain) / 2
+    top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+    bottom, right = int(round(mh - pad_y + 0.1)), int(round(mw - pad_x + 0.1))
+    labels = labels[top:bottom, left:right]
+    if labels.shape != (h, w):
+        labels = cv2.resize(labels, (w, h), interpolation=cv2.INTER_NEAREST)
+    return labels
+
+
+class OverlayRenderer:
+    """
+    Draws a result's instance masks and class labels over a frame. All masks
+    are folded into one id map and blended in a single pass through scratch
+    buffers kept between frames, instead of a plot() per view. The returned
+    frame is new each time, since the clip writer holds on to it.
+    """
+
+    def __init__(self, class_names: dict, colors: list, alpha: float = 0.5):
+        self.class_names = class_names
+        self.colors = np.array(colors, np.uint8)
+        self.alpha = alpha
+        self.color_layer = None
+        self.blended = None
+
+    def buffers(self, shape):
+        if self.color_layer is None or self.color_layer.shape != shape:
+            self.color_layer = np.empty(shape, np.uint8)
+            self.blended = np.empty(shape, np.uint8)
+        return self.color_layer, self.blended
+
+    def render(self, result, image: np.ndarray) -> np.ndarray:
+        output = image.copy()
+        boxes = result[0].boxes.data.cpu().numpy()
+        masks = result[0].masks
+        if masks is not None and len(boxes):
+            data = masks.data.cpu().numpy() > 0.5
+            labels = unletterbox(label_map(data), image.shape)
+            # Colour of each instance by class, with id 0 left unpainted
+            lut = np.zeros((len(boxes) + 1, 3), np.uint8)
+            lut[1:] = self.colors[boxes[:, 5].astype(np.int64) % len(self.colors)]
+            color_layer, blended = self.buffers(image.shape)
+            np.take(lut, labels, axis=0, out=color_layer)
+            cv2.addWeighted(
+                image, 1 - self.alpha, color_layer, self.alpha, 0, dst=blended
+            )
+            np.copyto(output, blended, where=(labels > 0)[..., None])
+
+        drawn = set()
+        for x1, y1, x2, y2, conf, cls in boxes:
+            cls = int(cls)
+            if cls in drawn:
+                continue
+            drawn.add(cls)
+            cv2.putText(
+                output,
+                self.class_names[cls],
+                (int(x1), int(y1) - 10),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.9,
+                self.colors[cls % len(self.colors)].tolist(),
+                2,
+            )
+        return output
@@ -0,0 +1,323 @@
+import time
+import asyncio
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any
+
+import cv2
+import numpy as np
+
+
+@dataclass
+class Frame:
+    frame_id: int
+    timestamp: float
+    image: np.ndarray
+    result: Any = None
+    # Set when the motion gate decided to reuse the previous result
+    skip: bool = False
+    # Motion gate thumbnail, passed back to the gate if the frame is inferred
+    thumb: np.ndarray = None
+
+
+# Queued after a source's last frame and routed like one, so the consumer
+# only stops once every frame still in a batch has come back
+END_OF_STREAM = Frame(-1, 0.0, None, skip=True)
+
+
+class DropOldestQueue:
+    """Bounded thread-safe queue that discards the oldest item when full."""
+
+    def __init__(self, maxsize: int = 2):
+        self.maxsize = maxsize
+        self.items = deque()
+        self.dropped = 0
+        self.cond = threading.Condition()
+
+    def put(self, item):
+        with self.cond:
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify()
+
+    def get(self, timeout: float = None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.items, timeout):
+                return None
+            return self.items.popleft()
+
+    def __len__(self):
+        with self.cond:
+            return len(self.items)
+
+    def clear(self):
+        with self.cond:
+            self.items.clear()
+
+
+class StageStats:
+    """Rolling per-stage latency samples, safe to record from any thread."""
+
+    def __init__(self, window: int = 300):
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        # Running totals since start, for counters that must never go down
+        self.counts = defaultdict(int)
+        self.totals = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self.lock:
+            self.samples[stage].append(seconds)
+            self.counts[stage] += 1
+            self.totals[stage] += seconds
+
+    def cumulative(self):
+        with self.lock:
+            return {stage: (n, self.totals[stage]) for stage, n in self.counts.items()}
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def summary(self):
+        with self.lock:
+            samples = {stage: list(values) for stage, values in self.samples.items()}
+        summary = {}
+        for stage, values in samples.items():
+            if not values:
+                continue
+            ms = np.array(values) * 1000
+            summary[stage] = {
+                "count": len(ms),
+                "avg_ms": float(ms.mean()),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max()),
+            }
+        return summary
+
+    def report(self):
+        return " | ".join(
+            f"{stage} {s['avg_ms']:.1f}ms (p95 {s['p95_ms']:.1f}ms)"
+            for stage, s in self.summary().items()
+        )
+
+
+class Source:
+    """
+    A capture thread feeding one camera's frames to the inference scheduler.
+    The camera is opened when the source starts and released when it stops,
+    so it is only held while someone is watching.
+    """
+
+    def __init__(
+        self, source_id, open_capture, stats, gate=None, size=(640, 480), queue_size=2
+    ):
+        self.source_id = source_id
+        self.open_capture = open_capture
+        self.cap = None
+        self.gate = gate
+        self.size = size
+        self.stats = stats
+        self.captured = DropOldestQueue(queue_size)
+        self.inferred = DropOldestQueue(queue_size)
+        self.ready: threading.Event = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self, ready: threading.Event) -> threading.Event:
+        """
+        Start a capture run and return its stop event, which identifies the
+        run. Each run has its own, so a previous run's thread that has not
+        exited yet can neither be revived nor touch this run's capture.
+        """
+        with self.lock:
+            self.stop_event.set()
+            self.ready = ready
+            self.stop_event = stop_event = threading.Event()
+            # Drop leftovers, including the end marker, of the previous run
+            self.captured.clear()
+            self.inferred.clear()
+            if self.gate is not None:
+                self.gate.reset()
+            self.thread = threading.Thread(
+                target=self._capture_loop,
+                args=(stop_event,),
+                name=f"capture-{self.source_id}",
+                daemon=True,
+            )
+            self.thread.start()
+        return stop_event
+
+    def stop(self, run: threading.Event = None) -> bool:
+        """Stop `run`, the current run by default; True if it was current."""
+        with self.lock:
+            run = run or self.stop_event
+            current = run is self.stop_event
+            thread = self.thread if current else None
+        run.set()
+        if thread is not None:
+            thread.join(timeout=1)
+        return current
+
+    @property
+    def dropped(self):
+        return {"capture": self.captured.dropped, "inference": self.inferred.dropped}
+
+    def _capture_loop(self, stop_event: threading.Event):
+        with self.stats.timer("open"):
+            cap = self.open_capture()
+        with self.lock:
+            if stop_event is self.stop_event:
+                self.cap = cap
+        try:
+            self._read_frames(cap, stop_event)
+        finally:
+            cap.release()
+            with self.lock:
+                stop_event.set()
+                if stop_event is self.stop_event:
+                    self.cap = None
+                    self.captured.put(END_OF_STREAM)
+            self.ready.set()
+
+    def _read_frames(self, cap, stop_event: threading.Event):
+        frame_id = 0
+        while not stop_event.is_set() and cap.isOpened():
+            with self.stats.timer("capture"):
+                ret, frame = cap.read()
+            if not ret:
+                break
+            with self.stats.timer("resize"):
+                resized_frame = cv2.resize(frame, self.size)
+            timestamp = time.time()
+            skip = False
+            thumb = None
+            if self.gate is not None:
+                with self.stats.timer("motion"):
+                    thumb = self.gate.thumbnail(resized_frame)
+                    skip = not self.gate.should_infer(thumb, timestamp)
+            with self.lock:
+                # A stopped run must not feed the queues a newer run reads
+                if stop_event.is_set():
+                    break
+                self.captured.put(
+                    Frame(frame_id, timestamp, resized_frame, skip=skip, thumb=thumb)
+                )
+            self.ready.set()
+            frame_id += 1
+
+    async def frames(self):
+        while True:
+            frame = await asyncio.to_thread(self.inferred.get, 0.1)
+            if frame is END_OF_STREAM:
+                return
+            if frame is not None:
+                yield frame
+
+
+class InferenceScheduler:
+    """
+    Gathers pending frames from every source for up to `max_latency` seconds
+    and runs them through the model as one batch, then routes each result
+    back to the source it came from.
+    """
+
+    def __init__(self, model, conf, stats, max_batch=4, max_latency=0.01):
+        self.model = model
+        self.conf = conf
+        self.stats = stats
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.sources: list[Source] = []
+        self.ready = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.batches = 0
+        self.batched_frames = 0
+
+    @property
+    def average_batch(self):
+        return self.batched_frames / self.batches if self.batches else 0.0
+
+    def add_source(self, source: Source) -> threading.Event:
+        if source not in self.sources:
+            self.sources.append(source)
+        run = source.start(self.ready)
+        if self.thread is None:
+            self.stop_event.clear()
+            self.thread = threading.Thread(
+                target=self._inference_loop, name="inference", daemon=True
+            )
+            self.thread.start()
+        return run
+
+    def remove_source(self, source: Source, run: threading.Event = None):
+        # Blocks while the capture thread exits; call it off the event loop.
+        # A source restarted since `run` began stays scheduled.
+        if source.stop(run) and source in self.sources:
+            self.sources.remove(source)
+
+    def close(self):
+        for source in list(self.sources):
+            self.remove_source(source)
+        self.stop_event.set()
+        self.ready.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _gather(self):
+        batch = []
+        deadline = None
+        while len(batch) < self.max_batch:
+            # Clear before polling so a frame captured mid-poll still wakes us
+            self.ready.clear()
+            for source in list(self.sources):
+                if len(batch) >= self.max_batch:
+                    break
+                frame = source.captured.get(timeout=0)
+                if frame is not None:
+                    batch.append((source, frame))
+
+            now = time.perf_counter()
+            if batch and deadline is None:
+                deadline = now + self.max_latency
+            if deadline is not None and now >= deadline:
+                break
+            self.ready.wait(0.1 if deadline is None else deadline - now)
+            if not batch and (not self.sources or self.stop_event.is_set()):
+                break
+        return batch
+
+    def _inference_loop(self):
+        while not self.stop_event.is_set():
+            batch = self._gather()
+            if not batch:
+                continue
+            # Frames the motion gate skipped ride along to keep their order
+            images = [frame.image for _, frame in batch if not frame.skip]
+            for source, frame in batch:
+                if not frame.skip and frame.thumb is not None:
+                    source.gate.accept(frame.thumb)
+            results = iter([])
+            if images:
+                with self.stats.timer("inference"):
+                    results = iter(self.model(images, verbose=False, conf=self.conf))
+                self.batches += 1
+                self.batched_frames += len(images)
+            for source, frame in batch:
+                if not frame.skip:
+                    # Keep the list-of-Results shape of a single-image call
+                    frame.result = [next(results)]
+                source.inferred.put(frame)
@@ -0,0 +1,156 @@
+import cv2
+import numpy as np
+
+
+def masks_to_numpy(result):
+    """Instance masks of a result as an (n, h, w) bool array at image size."""
+    # Imported here: ultralytics takes seconds to import and the server
+    # should be listening before the model is loaded
+    from ultralytics.utils.ops import scale_image
+
+    masks = result[0].masks
+    if masks is None:
+        return None
+    data = masks.data.cpu().numpy()
+    if not len(data):
+        return data.astype(bool)
+    image_shape = result[0].orig_shape
+    # scale_image undoes the letterbox padding; it works on (h, w, n)
+    scaled = scale_image(data.transpose(1, 2, 0), image_shape)
+    return scaled.transpose(2, 0, 1) > 0.5
+
+
+class DrapeMask:
+    """
+    HSV mask of the drape, cached between ticks and only recomputed when a
+    downscaled grayscale thumbnail of the scene has changed.
+    """
+
+    def __init__(self, lower_hsv, upper_hsv, change_threshold=6.0, thumb=(64, 48)):
+        self.lower_hsv = lower_hsv
+        self.upper_hsv = upper_hsv
+        self.change_threshold = change_threshold
+        self.thumb_size = thumb
+        self.thumb = None
+        self.mask = None
+        self.recomputed = 0
+
+    def get(self, image: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        thumb = cv2.resize(gray, self.thumb_size, interpolation=cv2.INTER_AREA)
+        thumb = thumb.astype(np.float32)
+        changed = (
+            self.mask is None
+            or self.mask.shape != image.shape[:2]
+            or np.abs(thumb - self.thumb).mean() > self.change_threshold
+        )
+        if changed:
+            hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+            self.mask = cv2.inRange(hsv_image, self.lower_hsv, self.upper_hsv) > 0
+            self.thumb = thumb
+            self.recomputed += 1
+        return self.mask
+
+
+def band_width(drape: np.ndarray) -> int:
+    # About 1% of the frame, enough to clear a slightly loose mask edge
+    return max(3, round(min(drape.shape) / 100))
+
+
+def mask_overlap(masks: np.ndarray, drape: np.ndarray, width: int = None) -> np.ndarray:
+    """
+    Fraction of a thin band around each (n, h, w) instance mask that lies
+    on the drape. The tool itself hides the cloth under it, so the drape
+    mask has a hole where the tool is and the mask's own pixels say nothing.
+    """
+    h, w = drape.shape
+    width = width or band_width(drape)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * width + 1,) * 2)
+    fractions = np.zeros(len(masks))
+    for i, mask in enumerate(masks):
+        mask = mask.astype(np.uint8)
+        x, y, bw, bh = cv2.boundingRect(mask)
+        if not bw:
+            continue
+        # Only the instance's neighbourhood is dilated, not the whole frame
+        x1, y1 = max(x - width, 0), max(y - width, 0)
+        x2, y2 = min(x + bw + width, w), min(y + bh + width, h)
+        crop = mask[y1:y2, x1:x2]
+        band = (cv2.dilate(crop, kernel) > 0) & (crop == 0)
+        on_drape = np.count_nonzero(band & drape[y1:y2, x1:x2])
+        fractions[i] = on_drape / max(np.count_nonzero(band), 1)
+    return fractions
+
+
+def box_overlap(boxes: np.ndarray, drape: np.ndarray, width: int = None) -> np.ndarray:
+    """Fraction of a band around each (n, 4) xyxy box that lies on the drape."""
+    h, w = drape.shape
+    width = width or band_width(drape)
+    integral = cv2.integral(drape.astype(np.uint8))
+
+    def on_drape_and_area(x1, y1, x2, y2):
+        x1, x2 = np.clip(x1, 0, w), np.clip(x2, 0, w)
+        y1, y2 = np.clip(y1, 0, h), np.clip(y2, 0, h)
+        on = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+        return on, (x2 - x1) * (y2 - y1)
+
+    x1, y1, x2, y2 = np.round(boxes).astype(np.int64).T
+    inner_on, inner_area = on_drape_and_area(x1, y1, x2, y2)
+    outer_on, outer_area = on_drape_and_area(
+        x1 - width, y1 - width, x2 + width, y2 + width
+    )
+    return (outer_on - inner_on) / np.maximum(outer_area - inner_area, 1)
+
+
+def overlap_fractions(detections, indices, drape: np.ndarray) -> np.ndarray:
+    """Drape overlap of the selected detections, by mask when available."""
+    masks = detections.masks
+    if masks is not None and len(masks) == len(detections.data):
+        return mask_overlap(masks[indices], drape)
+    return box_overlap(detections.data[indices, :4], drape)
+
+
+def classify_placement(detections, drape: np.ndarray, threshold: float, conf: float):
+    """
+    Status of the first confident detection of each class: "in place" when
+    at least `threshold` of the band around its mask (or box, without masks)
+    is on the drape.
+    """
+    data = detections.data
+    keep = data[:, 4] > conf
+    cls = data[:, 5].astype(np.int64)
+    # First confident detection per class, as the status check always used
+    _, first = np.unique(np.where(keep, cls, -1), return_index=True)
+    first = first[keep[first]]
+    if not len(first):
+        return {}
+
+    overlap = overlap_fractions(detections, first, drape)
+    return {
+        int(cls[i]): ("in place" if fraction >= threshold else "out of place", i)
+        for i, fraction in zip(first, overlap)
+    }
+
+
+if __name__ == "__main__":
+    from config import Config
+
+    # A grey tool lying on a green drape, one across its edge and one in
+    # the surgical site; only the first is in place
+    image = np.zeros((480, 640, 3), np.uint8)
+    image[:] = (60, 60, 60)
+    image[40:440, 40:600] = (92, 160, 40)
+    image[180:300, 240:400] = (60, 60, 60)
+    masks = np.zeros((3, 480, 640), bool)
+    masks[0, 80:120, 80:200] = True
+    masks[1, 200:240, 500:620] = True
+    masks[2, 220:260, 280:360] = True
+    for mask in masks:
+        image[mask] = (150, 150, 150)
+    config = Config()
+    drape = DrapeMask(np.array(config.lower_hsv), np.array(config.upper_hsv)).get(image)
+    boxes = np.array([[80, 80, 200, 120], [500, 200, 620, 240], [280, 220, 360, 260]])
+    print("mask overlap:", mask_overlap(masks, drape).round(2))
+    print("box overlap:", box_overlap(boxes, drape).round(2))
+    assert mask_overlap(masks, drape)[0] > 0.9 > mask_overlap(masks, drape)[1:].max()
+    assert box_overlap(boxes, drape)[0] > 0.9 > box_overlap(boxes, drape)[1:].max()
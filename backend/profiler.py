@@ -0,0 +1,45 @@
+import sys
+import time
+import threading
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread at a fixed interval and folds the
+    samples into collapsed stacks ("thread;outer;inner count"), the input
+    flamegraph tools expect. Nothing runs unless a profile is requested.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.lock = threading.Lock()
+
+    @property
+    def busy(self):
+        return self.lock.locked()
+
+    def sample(self, seconds: float) -> Counter:
+        own = threading.get_ident()
+        stacks = Counter()
+        with self.lock:
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    calls = []
+                    while frame is not None:
+                        code = frame.f_code
+                        where = f"{code.co_filename}:{frame.f_lineno}"
+                        calls.append(f"{code.co_name} ({where})")
+                        frame = frame.f_back
+                    calls.append(names.get(ident, str(ident)))
+                    stacks[";".join(reversed(calls))] += 1
+                time.sleep(self.interval)
+        return stacks
+
+
+def collapse(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,82 @@
+import base64
+import struct
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Union
+from urllib.parse import parse_qs, urlsplit
+
+# Binary messages start with a fixed little-endian header:
+#   version (u8) | kind (u8) | frame id (u32) | timestamp in seconds (f64)
+# followed by the payload (JPEG bytes for frames, UTF-8 JSON for status).
+#
+# Status payloads are versioned tool state events (see status.StatusLog):
+#   {"type": "snapshot", "run": r, "seq": n, "time": t,
+#    "tools": [{"tool": ..., ...}]}
+#   {"type": "delta", "run": r, "seq": n, "time": t, "tool": ...,
+#    "changes": {...}, "previous": {...}}
+# Sequence numbers count within one server run `r`. A snapshot is sent on
+# connect, or the missed deltas when the client connects with
+# ?run=<r>&since=<seq> and r is still the current run. Clients can send
+# {"type": "snapshot"} or {"type": "resume", "run": r, "since": <seq>} at
+# any time.
+VERSION = 1
+HEADER = struct.Struct("<BBId")
+
+FRAME = 1
+STATUS = 2
+
+
+@dataclass(eq=False)
+class Message:
+    kind: int
+    frame_id: int
+    timestamp: float
+    payload: Union[bytes, memoryview, str]
+
+    @cached_property
+    def binary(self) -> tuple[bytes, Union[bytes, memoryview]]:
+        """
+        Header and payload as the two fragments of one WebSocket message,
+        so the JPEG buffer is sent as it is rather than copied behind the
+        header.
+        """
+        payload = self.payload
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        header = HEADER.pack(
+            VERSION, self.kind, self.frame_id & 0xFFFFFFFF, self.timestamp
+        )
+        return header, payload
+
+    @cached_property
+    def text(self) -> str:
+        # Legacy clients get base64 JPEG frames and raw JSON status strings
+        if isinstance(self.payload, str):
+            return self.payload
+        return base64.b64encode(self.payload).decode("utf-8")
+
+
+def wants_binary(path: str) -> bool:
+    query = parse_qs(urlsplit(path).query)
+    return query.get("protocol") == ["binary"]
+
+
+def requested_source(path: str) -> int:
+    query = parse_qs(urlsplit(path).query)
+    try:
+        return int(query.get("source", ["0"])[0])
+    except ValueError:
+        return -1
+
+
+def requested_since(path: str):
+    query = parse_qs(urlsplit(path).query)
+    try:
+        return int(query["since"][0])
+    except (KeyError, ValueError):
+        return None
+
+
+def requested_run(path: str):
+    query = parse_qs(urlsplit(path).query)
+    return query.get("run", [None])[0]
@@ -0,0 +1,124 @@
+import os
+import mmap
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from segment_writer import Segment
+
+
+@dataclass
+class RingEntry:
+    name: str
+    local_path: str
+    start_time: float
+    end_time: float
+    size: int
+    tools: set = field(default_factory=set)
+    archived: bool = False
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SegmentRing:
+    """
+    Rolling on-disk buffer of the most recent encoded segments, indexed by
+    name, time and the tools seen in each segment. Old segments are evicted
+    once they fall outside the retention window or the byte budget.
+
+    Segments live in a run-<pid>-* subdirectory of `directory` that belongs
+    to this ring alone, so nothing else in the directory, nor another
+    server's buffer, is ever deleted.
+    """
+
+    def __init__(self, directory: str, retention: float = 600, max_bytes: int = 2**31):
+        self.directory = directory
+        self.retention = retention
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[str, RingEntry] = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # The index lives in memory, so buffers of runs that have exited are stale
+        for name in os.listdir(directory):
+            parts = name.split("-")
+            if len(parts) == 3 and parts[0] == "run" and parts[1].isdigit():
+                if not process_alive(int(parts[1])):
+                    shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+        self.run_dir = tempfile.mkdtemp(prefix=f"run-{os.getpid()}-", dir=directory)
+
+    def add(self, segment: Segment, tools: set) -> RingEntry:
+        local_path = os.path.join(self.run_dir, segment.name)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        os.replace(segment.local_path, local_path)
+        entry = RingEntry(
+            segment.name,
+            local_path,
+            segment.start_time,
+            segment.end_time,
+            os.path.getsize(local_path),
+            set(tools),
+        )
+        with self.lock:
+            self.entries[entry.name] = entry
+            self.total_bytes += entry.size
+            self._evict(entry.end_time)
+        return entry
+
+    def _evict(self, now: float):
+        while self.entries:
+            oldest = next(iter(self.entries.values()))
+            expired = now - oldest.end_time > self.retention
+            if not expired and self.total_bytes <= self.max_bytes:
+                break
+            del self.entries[oldest.name]
+            self.total_bytes -= oldest.size
+            try:
+                os.remove(oldest.local_path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, name: str) -> RingEntry:
+        with self.lock:
+            return self.entries.get(name)
+
+    def between(self, start: float, end: float, tool: str = None):
+        with self.lock:
+            return [
+                entry
+                for entry in self.entries.values()
+                if entry.end_time >= start
+                and entry.start_time <= end
+                and (tool is None or tool in entry.tools)
+            ]
+
+    def latest(self, tool: str) -> RingEntry:
+        with self.lock:
+            for entry in reversed(self.entries.values()):
+                if tool in entry.tools:
+                    return entry
+        return None
+
+    def read(self, entry: RingEntry, start: int, end: int) -> bytes:
+        """Read bytes [start, end] of a segment, or None if it was evicted."""
+        try:
+            with open(entry.local_path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return mm[start : end + 1]
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def close(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+        shutil.rmtree(self.run_dir, ignore_errors=True)
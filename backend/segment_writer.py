@@ -0,0 +1,140 @@
+import os
+import queue
+import subprocess
+import threading
+from dataclasses import dataclass
+from typing import Callable
+import numpy as np
+from imageio_ffmpeg import get_ffmpeg_exe
+
+
+@dataclass
+class Segment:
+    name: str
+    local_path: str
+    start_time: float
+    end_time: float
+    frame_count: int
+    context: object = None
+
+
+class SegmentWriter:
+    """
+    Streams frames into a persistent ffmpeg process as they are produced and
+    starts a new file on every rotate(), so a clip never has to be buffered
+    in memory. Output is constant frame rate: frames are placed by their
+    capture timestamps, holding the previous frame over gaps and dropping
+    frames that land in an already written slot.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        on_segment: Callable[[Segment], None],
+        fps: int = 15,
+        size=(640, 480),
+        queue_size: int = 60,
+    ):
+        self.directory = directory
+        self.on_segment = on_segment
+        self.fps = fps
+        self.size = size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.proc: subprocess.Popen = None
+        self.segment: Segment = None
+        self.written = 0
+        self.last_frame = None
+        os.makedirs(directory, exist_ok=True)
+        self.thread = threading.Thread(
+            target=self._writer_loop, name="segment-writer", daemon=True
+        )
+        self.thread.start()
+
+    def write(self, frame: np.ndarray, timestamp: float):
+        try:
+            self.queue.put_nowait(("frame", frame, timestamp))
+        except queue.Full:
+            self.dropped += 1
+
+    def rotate(self, name: str, context=None):
+        # Control messages are never dropped, so segment boundaries are exact
+        self.queue.put(("rotate", name, context))
+
+    def close(self):
+        self.queue.put(("close", None, None))
+        self.thread.join()
+
+    def _writer_loop(self):
+        while True:
+            kind, value, extra = self.queue.get()
+            try:
+                if kind == "frame":
+                    self._write_frame(value, extra)
+                elif kind == "rotate":
+                    self._finish(value, extra)
+                else:
+                    self._finish(None, None)
+                    return
+            except Exception as e:
+                print(f"Segment writer error: {e}")
+                self._abort()
+
+    def _open(self, timestamp: float):
+        width, height = self.size
+        local_path = os.path.join(self.directory, f"{timestamp}.mp4")
+        # fmt: off
+        command = [
+            get_ffmpeg_exe(), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24",
+            "-s", f"{width}x{height}", "-r", str(self.fps), "-i", "-",
+            "-an", "-c:v", "libx264", "-preset", "veryfast",
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            local_path,
+        ]
+        # fmt: on
+        self.proc = subprocess.Popen(command, stdin=subprocess.PIPE)
+        self.segment = Segment("", local_path, timestamp, timestamp, 0)
+        self.written = 0
+        self.last_frame = None
+
+    def _write_frame(self, frame: np.ndarray, timestamp: float):
+        if self.proc is None:
+            self._open(timestamp)
+        slot = int((timestamp - self.segment.start_time) * self.fps)
+        if slot < self.written:
+            return
+        # Hold the previous frame over any slots the camera skipped
+        while self.last_frame is not None and self.written < slot:
+            self.proc.stdin.write(self.last_frame)
+            self.written += 1
+        self.last_frame = np.ascontiguousarray(frame).data
+        self.proc.stdin.write(self.last_frame)
+        self.written += 1
+        self.segment.end_time = timestamp
+        self.segment.frame_count += 1
+
+    def _finish(self, name: str, context):
+        if self.proc is None:
+            return
+        self.proc.stdin.close()
+        returncode = self.proc.wait()
+        segment = self.segment
+        self.proc = None
+        self.segment = None
+        if returncode != 0:
+            print(f"ffmpeg exited with {returncode} for {segment.local_path}")
+            return
+        if name is None:
+            os.remove(segment.local_path)
+            return
+        segment.name = name
+        segment.context = context
+        self.on_segment(segment)
+
+    def _abort(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+            self.segment = None
@@ -0,0 +1,106 @@
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sightings (
+    id INTEGER PRIMARY KEY,
+    source_id INTEGER NOT NULL,
+    time REAL NOT NULL,
+    tool TEXT NOT NULL,
+    status TEXT NOT NULL,
+    confidence REAL,
+    x1 REAL,
+    y1 REAL,
+    x2 REAL,
+    y2 REAL,
+    segment TEXT
+);
+CREATE INDEX IF NOT EXISTS sightings_tool_time ON sightings (tool, time);
+CREATE INDEX IF NOT EXISTS sightings_status_time ON sightings (status, time);
+"""
+
+COLUMNS = ["source_id", "time", "tool", "status", "confidence", "box", "segment"]
+
+
+class SightingIndex:
+    """
+    Append-only SQLite log of every status tick, one row per tool, so
+    questions like "when was gauze out of place between 10:02 and 10:07"
+    are an index lookup instead of a scan of the clip storage.
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def record(self, source_id: int, timestamp: float, sightings: list[dict]):
+        rows = []
+        for s in sightings:
+            box = s.get("box") or (None, None, None, None)
+            rows.append(
+                (source_id, timestamp, s["tool"], s["status"], s.get("confidence"))
+                + tuple(box)
+            )
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO sightings"
+                " (source_id, time, tool, status, confidence, x1, y1, x2, y2)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def assign_segment(self, source_id: int, segment: str, start: float, end: float):
+        # Segment names are only known once the clip is rotated
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE sightings SET segment = ?"
+                " WHERE source_id = ? AND segment IS NULL AND time BETWEEN ? AND ?",
+                (segment, source_id, start, end),
+            )
+
+    def query(
+        self,
+        tool: str = None,
+        status: str = None,
+        start: float = None,
+        end: float = None,
+        source_id: int = None,
+        limit: int = 1000,
+    ):
+        clauses, params = [], []
+        for column, value in (("tool", tool), ("status", status)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if source_id is not None:
+            clauses.append("source_id = ?")
+            params.append(source_id)
+        if start is not None:
+            clauses.append("time >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("time <= ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = (
+            "SELECT source_id, time, tool, status, confidence, x1, y1, x2, y2, segment"
+            f" FROM sightings {where} ORDER BY time DESC LIMIT ?"
+        )
+        with self.lock:
+            rows = self.conn.execute(sql, params + [limit]).fetchall()
+        return [
+            dict(
+                zip(
+                    COLUMNS,
+                    (*row[:5], None if row[5] is None else list(row[5:9]), row[9]),
+                )
+            )
+            for row in rows
+        ]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
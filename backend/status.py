@@ -0,0 +1,85 @@
+import json
+import uuid
+from collections import deque
+
+
+def encode(event: dict) -> str:
+    return json.dumps(event, separators=(",", ":"))
+
+
+class StatusLog:
+    """
+    Versioned tool state of one source. Every change to a tool's fields is
+    a delta event with the next sequence number, and the recent events are
+    kept so a reconnecting client can resume from the last one it saw
+    instead of starting over from a snapshot. Sequence numbers restart with
+    every server run, so events carry the log's run id and a client from
+    an earlier run gets a snapshot instead of someone else's deltas.
+    """
+
+    def __init__(self, history: int = 512):
+        self.run = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.tools: dict[str, dict] = {}
+        self.events = deque(maxlen=history)
+
+    def update(self, entries: list[dict], timestamp: float) -> list[dict]:
+        """
+        Merge per-tool entries into the state and return the resulting
+        delta events. Entries may carry only some fields; the rest keep
+        their current values.
+        """
+        events = []
+        for entry in entries:
+            tool = entry["tool"]
+            current = self.tools.setdefault(tool, {})
+            changes = {
+                key: value
+                for key, value in entry.items()
+                if key != "tool" and current.get(key) != value
+            }
+            if not changes:
+                continue
+            self.seq += 1
+            event = {
+                "type": "delta",
+                "run": self.run,
+                "seq": self.seq,
+                "time": timestamp,
+                "tool": tool,
+                "changes": changes,
+            }
+            # What it changed from, for the fields a log line would show
+            previous = {
+                key: current[key]
+                for key in changes
+                if key in current and not isinstance(current[key], list)
+            }
+            if previous:
+                event["previous"] = previous
+            current.update(changes)
+            self.events.append(event)
+            events.append(event)
+        return events
+
+    def snapshot(self, timestamp: float) -> dict:
+        return {
+            "type": "snapshot",
+            "run": self.run,
+            "seq": self.seq,
+            "time": timestamp,
+            "tools": [{"tool": tool, **fields} for tool, fields in self.tools.items()],
+        }
+
+    def since(self, seq: int, run: str):
+        """
+        Events after `seq` of run `run`, or None when that is another run or
+        the events are no longer all kept.
+        """
+        if run != self.run or seq > self.seq:
+            return None
+        if seq == self.seq:
+            return []
+        if not self.events or self.events[0]["seq"] > seq + 1:
+            return None
+        return [event for event in self.events if event["seq"] > seq]
@@ -0,0 +1,247 @@
+import itertools
+import numpy as np
+from window import Detections
+
+MISSING = "missing"
+
+
+class Track:
+    __slots__ = (
+        "track_id",
+        "cls",
+        "box",
+        "velocity",
+        "confidence",
+        "first_seen",
+        "last_seen",
+        "updated",
+        "hits",
+        "status",
+        "status_since",
+        "candidate",
+        "candidate_since",
+        "candidate_hits",
+        "detection_index",
+    )
+
+    def __init__(self, track_id, cls, box, confidence, timestamp):
+        self.track_id = track_id
+        self.cls = cls
+        self.box = box
+        self.velocity = np.zeros(4)
+        self.confidence = confidence
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.updated = timestamp
+        self.hits = 1
+        self.status = None
+        self.status_since = timestamp
+        # A different status seen lately, not yet held long enough to take
+        self.candidate = None
+        self.candidate_since = timestamp
+        self.candidate_hits = 0
+        # Index of the matching detection in the latest update, or -1
+        self.detection_index = -1
+
+    def predict(self, timestamp, horizon):
+        # Only extrapolate a short way; a lost tool is looked for where it was
+        return self.box + self.velocity * min(timestamp - self.updated, horizon)
+
+    def as_dict(self):
+        return {
+            "track_id": self.track_id,
+            "status": self.status,
+            "since": self.status_since,
+        }
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (n, 4) and (m, 4) xyxy boxes."""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return intersection / np.maximum(union, 1e-6)
+
+
+def greedy_match(iou: np.ndarray, threshold: float):
+    """Match rows to columns by descending IoU, each used at most once."""
+    matches = []
+    if not iou.size:
+        return matches
+    rows, cols = np.unravel_index(np.argsort(-iou, axis=None), iou.shape)
+    used_rows, used_cols = set(), set()
+    for r, c in zip(rows, cols):
+        if iou[r, c] < threshold:
+            break
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        matches.append((r, c))
+    return matches
+
+
+class IoUTracker:
+    """
+    ByteTrack-style tracker over the YOLO boxes. Confident detections are
+    matched to existing tracks first, then low-confidence ones can keep an
+    unmatched track alive; only confident detections start new tracks.
+    Boxes are matched against a constant-velocity prediction of each track.
+    """
+
+    def __init__(
+        self,
+        high_conf=0.5,
+        low_conf=0.1,
+        iou_threshold=0.3,
+        min_hits=3,
+        missing_after=1.0,
+        forget_after=300.0,
+        status_hold_frames=3,
+        status_hold=1.0,
+    ):
+        self.high_conf = high_conf
+        self.low_conf = low_conf
+        self.iou_threshold = iou_threshold
+        self.min_hits = min_hits
+        self.missing_after = missing_after
+        self.forget_after = forget_after
+        self.status_hold_frames = status_hold_frames
+        self.status_hold = status_hold
+        self.tracks: list[Track] = []
+        self.ids = itertools.count(1)
+
+    def update(self, detections: Detections, timestamp: float) -> list[Track]:
+        data = detections.data
+        for track in self.tracks:
+            track.detection_index = -1
+
+        unmatched = list(range(len(self.tracks)))
+        for low_stage in (False, True):
+            if low_stage:
+                mask = (data[:, 4] >= self.low_conf) & (data[:, 4] < self.high_conf)
+            else:
+                mask = data[:, 4] >= self.high_conf
+            candidates = np.flatnonzero(mask)
+            matched = self._match(candidates, unmatched, data, timestamp)
+            unmatched = [t for t in unmatched if t not in matched]
+            if not low_stage:
+                # Only confident detections may start a track
+                new = set(candidates) - set(matched.values())
+                for i in sorted(new):
+                    self.tracks.append(
+                        Track(
+                            next(self.ids),
+                            int(data[i, 5]),
+                            data[i, :4].astype(np.float64),
+                            float(data[i, 4]),
+                            timestamp,
+                        )
+                    )
+                    self.tracks[-1].detection_index = int(i)
+
+        self._age(timestamp)
+        return self.confirmed()
+
+    def _match(self, candidates, track_indices, data, timestamp):
+        if not len(candidates) or not track_indices:
+            return {}
+        tracks = [self.tracks[t] for t in track_indices]
+        predicted = np.array(
+            [track.predict(timestamp, self.missing_after) for track in tracks]
+        )
+        iou = iou_matrix(predicted, data[candidates, :4].astype(np.float64))
+        # Boxes of different classes never match
+        track_classes = np.array([t.cls for t in tracks])
+        same_class = track_classes[:, None] == data[candidates, 5].astype(np.int64)
+        iou = np.where(same_class, iou, 0)
+
+        matched = {}
+        for r, c in greedy_match(iou, self.iou_threshold):
+            track = tracks[r]
+            i = candidates[c]
+            box = data[i, :4].astype(np.float64)
+            dt = timestamp - track.updated
+            if dt > 0:
+                # Smooth the velocity so one jittery box does not fling the track
+                track.velocity = 0.5 * track.velocity + 0.5 * (box - track.box) / dt
+            track.box = box
+            track.confidence = float(data[i, 4])
+            track.last_seen = timestamp
+            track.updated = timestamp
+            track.hits += 1
+            track.detection_index = int(i)
+            if track.status == MISSING:
+                track.status = None
+                track.status_since = timestamp
+            matched[track_indices[r]] = i
+        return matched
+
+    def _age(self, timestamp: float):
+        kept = []
+        for track in self.tracks:
+            unseen = timestamp - track.last_seen
+            if unseen > self.forget_after:
+                continue
+            if track.hits < self.min_hits and unseen > self.missing_after:
+                # Never confirmed, so it was most likely noise
+                continue
+            if unseen > self.missing_after and track.status != MISSING:
+                track.status = MISSING
+                track.status_since = timestamp
+            kept.append(track)
+        self.tracks = kept
+
+    def propagate(self, timestamp: float):
+        """
+        Carry the tracks over a frame that skipped inference. The scene is
+        assumed unchanged, so visible tracks count as seen; their boxes are
+        still predicted from the last real update.
+        """
+        for track in self.tracks:
+            track.detection_index = -1
+            if track.status != MISSING:
+                track.last_seen = timestamp
+
+    def set_status(self, track: Track, status: str, timestamp: float):
+        """
+        Change a track's status only once the new one has been seen on
+        `status_hold_frames` frames in a row over at least `status_hold`
+        seconds, so a tool near the overlap threshold does not flip on
+        every frame.
+        """
+        if track.status in (None, MISSING):
+            # Nothing to hold against yet
+            track.candidate = None
+            if track.status != status:
+                track.status = status
+                track.status_since = timestamp
+            return
+        if status == track.status:
+            track.candidate = None
+            return
+        if status != track.candidate:
+            track.candidate = status
+            track.candidate_since = timestamp
+            track.candidate_hits = 0
+        track.candidate_hits += 1
+        if (
+            track.candidate_hits >= self.status_hold_frames
+            and timestamp - track.candidate_since >= self.status_hold
+        ):
+            track.status = status
+            track.status_since = track.candidate_since
+            track.candidate = None
+
+    def confirmed(self) -> list[Track]:
+        return [track for track in self.tracks if track.hits >= self.min_hits]
+
+    def counts(self) -> dict[int, int]:
+        counts = {}
+        for track in self.confirmed():
+            if track.status != MISSING:
+                counts[track.cls] = counts.get(track.cls, 0) + 1
+        return counts
@@ -0,0 +1,135 @@
+import numpy as np
+from placement import masks_to_numpy
+
+MIN_CONFIDENCE = 0.5
+
+
+def stack_window(results):
+    # One device-to-host copy per frame instead of one torch op per element
+    boxes = [result[0].boxes.data.cpu().numpy() for result in results]
+    counts = [len(b) for b in boxes]
+    data = np.concatenate(boxes) if boxes else np.empty((0, 6), dtype=np.float32)
+    frame_index = np.repeat(np.arange(len(results)), counts)
+    return frame_index, data.reshape(-1, 6)
+
+
+def find_best_result(results):
+    """
+    Pick the frame that contains every class seen in more than half of the
+    window, with the highest total confidence over those classes.
+    """
+    total_results = len(results)
+    if not total_results:
+        return None, None
+    frame_index, data = stack_window(results)
+    confidence = data[:, 4]
+    cls = data[:, 5].astype(np.int64)
+    confident = confidence > MIN_CONFIDENCE
+
+    # Which classes each frame detected confidently
+    num_classes = int(cls.max()) + 1 if len(cls) else 0
+    presence = np.zeros((total_results, num_classes), dtype=bool)
+    presence[frame_index[confident], cls[confident]] = True
+
+    # Classes detected in more than half of the results
+    required = presence.sum(axis=0) > total_results / 2
+
+    # Sum confidences of the required classes per frame
+    keep = confident & required[cls]
+    total_confidence = np.bincount(
+        frame_index[keep], weights=confidence[keep], minlength=total_results
+    )
+    has_required = presence[:, required].all(axis=1)
+    total_confidence = np.where(has_required, total_confidence, 0)
+
+    frame_idx = int(np.argmax(total_confidence))
+    if total_confidence[frame_idx] <= 0:
+        return None, None
+    return frame_idx, results[frame_idx]
+
+
+class Detections:
+    """Compact per-frame summary: an (n, 6) array of x1, y1, x2, y2, conf, cls."""
+
+    __slots__ = ("frame_id", "data", "masks", "image")
+
+    def __init__(self, frame_id: int, data: np.ndarray):
+        self.frame_id = frame_id
+        self.data = data
+        # Only filled in for frames that become a best-frame candidate
+        self.masks = None
+        self.image = None
+
+    @classmethod
+    def from_result(cls, frame_id: int, result):
+        return cls(frame_id, result[0].boxes.data.cpu().numpy().reshape(-1, 6))
+
+    @property
+    def boxes(self):
+        return self.data[:, :4]
+
+    @property
+    def confidence(self):
+        return self.data[:, 4]
+
+    @property
+    def cls(self):
+        return self.data[:, 5].astype(np.int64)
+
+
+class WindowAggregator:
+    """
+    Incremental version of find_best_result.
+
+    The required classes are only known at tick time, so the best frame is
+    tracked for every subset of classes: a frame is a candidate for a subset
+    when it confidently detects all of that subset's classes, scored by the
+    summed confidence of those classes. At tick time the required subset is
+    looked up directly, so a tick is O(1) in the window length and only
+    2^num_classes compact summaries are kept alive.
+    """
+
+    def __init__(self, num_classes: int, keep_masks: bool = False):
+        self.num_classes = num_classes
+        self.keep_masks = keep_masks
+        subsets = np.arange(1 << num_classes)
+        # subset_classes[s, c] is True when class c belongs to subset s
+        self.subset_classes = (subsets[:, None] >> np.arange(num_classes)) & 1 == 1
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.class_counts = np.zeros(self.num_classes, dtype=np.int64)
+        self.best_scores = np.zeros(len(self.subset_classes))
+        self.best: list[Detections] = [None] * len(self.subset_classes)
+
+    def add(self, frame_id: int, result) -> Detections:
+        detections = Detections.from_result(frame_id, result)
+        cls = detections.cls
+        keep = (detections.confidence > MIN_CONFIDENCE) & (cls < self.num_classes)
+        sums = np.bincount(
+            cls[keep], weights=detections.confidence[keep], minlength=self.num_classes
+        )
+        present = np.bincount(cls[keep], minlength=self.num_classes) > 0
+
+        self.count += 1
+        self.class_counts += present
+
+        scores = self.subset_classes @ sums
+        candidates = ~(self.subset_classes & ~present).any(axis=1)
+        improved = np.flatnonzero(candidates & (scores > self.best_scores))
+        if len(improved) and self.keep_masks:
+            detections.masks = masks_to_numpy(result)
+            detections.image = result[0].orig_img
+        self.best_scores[improved] = scores[improved]
+        for subset in improved:
+            self.best[subset] = detections
+        return detections
+
+    def best_result(self) -> Detections:
+        required = self.class_counts > self.count / 2
+        subset = int(required @ (1 << np.arange(self.num_classes)))
+        # With nothing required every frame scores zero, so nothing is chosen
+        if subset == 0:
+            return None
+        return self.best[subset]
@@ -1,13 +1,13 @@
-from collections import defaultdict
 import json
 import time
 import cv2
 import websockets
 import base64
 import asyncio
-from ultralytics import YOLO
+from backends import load_backend
+from window import find_best_result
 
-model = YOLO("./Experiments/runs/segment/train/weights/best.pt")
+model = load_backend("torch", "./Experiments/runs/segment/train/weights/best.pt")
 
 PORT = 8080
 
@@ -72,53 +72,6 @@ async def handle_connection(ws: websockets.WebSocketClientProtocol):
     # cv2.destroyAllWindows()
 
 
-def find_best_result(results):
-    total_results = len(results)
-    class_counters = defaultdict(int)
-
-    # Step 1: Count the classes detected in each result
-    for result_obj in results:
-        result_obj = result_obj[0]
-        result_classes = set()
-        boxes_data = result_obj.boxes.data
-        for detection in boxes_data:
-            confidence = detection[4]
-            cls = int(detection[5])
-            if confidence > 0.5 and cls not in result_classes:
-                class_counters[cls] += 1
-                result_classes.add(cls)
-
-    # Step 2: Identify classes detected in more than half of the results
-    required_classes = [
-        cls for cls, count in class_counters.items() if count > total_results / 2
-    ]
-
-    # Step 3: Find the best result object
-    best_result = None
-    highest_total_confidence = 0
-    frame_idx = None
-
-    for i, result_obj in enumerate(results):
-        detected_classes = set()
-        confidences_per_class = defaultdict(float)
-        boxes_data = result_obj[0].boxes.data
-        for detection in boxes_data:
-            confidence = detection[4]
-            cls = int(detection[5])
-            if cls in required_classes and confidence > 0.5:
-                detected_classes.add(cls)
-                confidences_per_class[cls] += confidence
-
-        if set(required_classes).issubset(detected_classes):
-            total_confidence = sum(confidences_per_class.values())
-            if total_confidence > highest_total_confidence:
-                highest_total_confidence = total_confidence
-                best_result = result_obj
-                frame_idx = i
-
-    return frame_idx, best_result
-
-
 async def start_server():
     server = await websockets.serve(handle_connection, "localhost", PORT)
     print(f"WebSocket server started on port {PORT}")
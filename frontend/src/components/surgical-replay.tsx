@@ -3,6 +3,8 @@ import { ref, getDownloadURL } from 'firebase/storage';
 import { storage } from '../lib/firebase';
 import { useToolContext } from './tool-context';
 
+const REPLAY_SERVER = 'http://localhost:8080';
+
 interface ItemOverlayProps {
   item: string;
   onClose: () => void;
@@ -34,6 +36,20 @@ const ItemOverlay: React.FC<ItemOverlayProps> = ({ item, onClose }) => {
         }
 
         const videoPath = toolInfo.last_seen;
+
+        // Recent clips are served by the tracker itself; older ones come
+        // from the Firebase archive
+        const localUrl = `${REPLAY_SERVER}/replay/${videoPath}`;
+        try {
+          const probe = await fetch(localUrl, { headers: { Range: 'bytes=0-0' } });
+          if (probe.ok) {
+            setVideoUrl(localUrl);
+            return;
+          }
+        } catch (error) {
+          console.warn('Local replay unavailable:', error);
+        }
+
         const storageRef = ref(storage, videoPath);
 
         const url = await getDownloadURL(storageRef);
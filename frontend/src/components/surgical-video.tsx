@@ -1,14 +1,66 @@
 import React, { useState, useEffect, useRef } from "react";
-import { useToolContext } from './tool-context';
+import { ToolData, useToolContext } from './tool-context';
+
+// Binary frames start with a little-endian header:
+// version (u8) | kind (u8) | frame id (u32) | timestamp (f64)
+const HEADER_SIZE = 14;
+const KIND_FRAME = 1;
+const KIND_STATUS = 2;
+
+// Status arrives as a snapshot on connect, then as deltas with consecutive
+// sequence numbers; a gap means a missed delta, so ask to resume. Numbers
+// restart when the server does, so a delta of another run needs a snapshot
+interface StatusEvent {
+    type: "snapshot" | "delta";
+    run: string;
+    seq: number;
+    tools?: ToolData[];
+    tool?: string;
+    changes?: Partial<ToolData>;
+}
 
 const SurgicalVideo = () => {
-    const [imageData, setImageData] = useState<string>("");
+    const [imageSrc, setImageSrc] = useState<string>("");
     const { updateToolData } = useToolContext();
     const ws = useRef<WebSocket | null>(null);
 
     useEffect(() => {
         // Initialize WebSocket connection
-        ws.current = new WebSocket("ws://localhost:8080");
+        ws.current = new WebSocket("ws://localhost:8080/?protocol=binary");
+        ws.current.binaryType = "arraybuffer";
+        let objectUrl: string | null = null;
+        const tools = new Map<string, ToolData>();
+        let run: string | null = null;
+        let seq = -1;
+
+        const applyStatus = (event: StatusEvent) => {
+            if (event.type === "snapshot") {
+                tools.clear();
+                event.tools?.forEach((tool) => tools.set(tool.tool, tool));
+                run = event.run;
+            } else if (event.run !== run) {
+                ws.current?.send(JSON.stringify({ type: "snapshot" }));
+                return;
+            } else if (event.seq <= seq) {
+                return; // already applied, e.g. replayed after a resume
+            } else if (event.seq !== seq + 1) {
+                ws.current?.send(JSON.stringify({ type: "resume", run, since: seq }));
+                return;
+            } else if (event.tool) {
+                const current = tools.get(event.tool) ?? ({ tool: event.tool } as ToolData);
+                tools.set(event.tool, { ...current, ...event.changes });
+            }
+            seq = event.seq;
+            updateToolData(Array.from(tools.values()));
+        };
+
+        const handleStatus = (data: string) => {
+            try {
+                applyStatus(JSON.parse(data));
+            } catch (error) {
+                console.error("Error parsing tool data:", error);
+            }
+        };
 
         ws.current.onopen = () => {
             console.log("WebSocket connection established");
@@ -16,17 +68,26 @@ const SurgicalVideo = () => {
 
         ws.current.onmessage = (event: MessageEvent) => {
             const data = event.data;
-            if (typeof data === "string") {
-                if (data.startsWith("image:")) {
-                    setImageData(data.slice(6));
-                } else if (data.startsWith("[")) {
-                    try {
-                        const parsedData = JSON.parse(data);
-                        updateToolData(parsedData);
-                        console.log(parsedData);
-                    } catch (error) {
-                        console.error("Error parsing tool data:", error);
+            if (data instanceof ArrayBuffer) {
+                const kind = new DataView(data).getUint8(1);
+                const payload = new Uint8Array(data, HEADER_SIZE);
+                if (kind === KIND_FRAME) {
+                    const url = URL.createObjectURL(
+                        new Blob([payload], { type: "image/jpeg" })
+                    );
+                    if (objectUrl) {
+                        URL.revokeObjectURL(objectUrl);
                     }
+                    objectUrl = url;
+                    setImageSrc(url);
+                } else if (kind === KIND_STATUS) {
+                    handleStatus(new TextDecoder().decode(payload));
+                }
+            } else if (typeof data === "string") {
+                if (data.startsWith("{")) {
+                    handleStatus(data);
+                } else {
+                    setImageSrc(`data:image/jpeg;base64,${data}`);
                 }
             }
         };
@@ -44,17 +105,16 @@ const SurgicalVideo = () => {
             if (ws.current) {
                 ws.current.close();
             }
+            if (objectUrl) {
+                URL.revokeObjectURL(objectUrl);
+            }
         };
     }, []);
 
     return (
         <div className="w-[1117px] flex flex-col items-center justify-center bg-gray-100 rounded-lg shadow-md">
             <img
-                src={
-                    imageData
-                        ? `data:image/jpeg;base64,${imageData}`
-                        : undefined
-                }
+                src={imageSrc || undefined}
                 alt="Surgical video frame"
                 className="w-[1117px] object-contain"
             />
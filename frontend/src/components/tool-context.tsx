@@ -1,9 +1,17 @@
 import React, { createContext, useState, useContext, ReactNode } from 'react';
 
-interface ToolData {
+export interface ToolInstance {
+  track_id: number;
+  status: string;
+  since: number;
+}
+
+export interface ToolData {
   tool: string;
   status: string;
   last_seen: string;
+  count?: number;
+  instances?: ToolInstance[];
 }
 
 interface ToolContextType {
@@ -1,37 +1,284 @@
-import asyncio
 import json
+import time
+import asyncio
+import argparse
+import threading
 import cv2
 from aiohttp import web
-from aiortc import RTCPeerConnection, RTCSessionDescription
-from aiortc.contrib.media import MediaPlayer
+from av import VideoFrame
+from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
+from aiortc.mediastreams import VIDEO_CLOCK_RATE, VIDEO_TIME_BASE
+
+
+class SharedCapture:
+    """
+    One camera for every peer and for the snapshot endpoint. A reader thread
+    keeps only the latest frame, so nobody waits on frames they would drop.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.cap = None
+        self.frame = None
+        self.frame_id = 0
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.cap = cv2.VideoCapture(self.source)
+            if not self.cap.isOpened():
+                self.cap = None
+                raise RuntimeError(f"Failed to open video source {self.source!r}")
+            self.thread = threading.Thread(target=self._read_loop, daemon=True)
+            self.thread.start()
+
+    def _read_loop(self):
+        while not self.stop_event.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            with self.lock:
+                self.frame = frame
+                self.frame_id += 1
+
+    def latest(self):
+        with self.lock:
+            return self.frame_id, self.frame
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+        if self.cap is not None:
+            self.cap.release()
+
+
+class TrackerPipeline:
+    """
+    Runs the YOLO model on the newest captured frame, once for all peers,
+    and keeps the annotated frame and the tool counts it saw. Inference
+    only runs while some track is watching.
+    """
+
+    def __init__(self, capture: SharedCapture, weights: str, confidence: float):
+        self.capture = capture
+        self.weights = weights
+        self.confidence = confidence
+        self.model = None
+        self.viewers = 0
+        self.watching = asyncio.Event()
+        self.updated = asyncio.Condition()
+        self.frame_id = 0
+        self.annotated = None
+        self.status = {}
+        self.seq = 0
+        self.channels = set()
+        self.task = None
+
+    def subscribe(self):
+        self.viewers += 1
+        self.watching.set()
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def unsubscribe(self):
+        self.viewers -= 1
+        if self.viewers <= 0:
+            self.viewers = 0
+            self.watching.clear()
+
+    def infer(self, frame):
+        if self.model is None:
+            from ultralytics import YOLO
+
+            self.model = YOLO(self.weights)
+        result = self.model.predict(frame, conf=self.confidence, verbose=False)
+        counts = {}
+        for cls in result[0].boxes.cls.tolist():
+            name = result[0].names[int(cls)]
+            counts[name] = counts.get(name, 0) + 1
+        return result[0].plot(), counts
+
+    async def run(self):
+        last_id = 0
+        while True:
+            await self.watching.wait()
+            frame_id, frame = self.capture.latest()
+            if frame is None or frame_id == last_id:
+                await asyncio.sleep(0.005)
+                continue
+            last_id = frame_id
+            annotated, counts = await asyncio.to_thread(self.infer, frame)
+            async with self.updated:
+                self.frame_id = frame_id
+                self.annotated = annotated
+                self.updated.notify_all()
+            if counts != self.status:
+                self.status = counts
+                self.seq += 1
+                self.broadcast_status()
+
+    async def next_frame(self, after: int):
+        async with self.updated:
+            await self.updated.wait_for(lambda: self.frame_id > after)
+            return self.frame_id, self.annotated
+
+    def status_message(self) -> str:
+        return json.dumps(
+            {
+                "type": "status",
+                "seq": self.seq,
+                "time": time.time(),
+                "tools": self.status,
+            }
+        )
+
+    def broadcast_status(self):
+        message = self.status_message()
+        for channel in list(self.channels):
+            if channel.readyState == "open":
+                channel.send(message)
+
+
+# From full quality down to what still shows the tools on a congested link
+QUALITY_LEVELS = ((1.0, 30), (0.75, 20), (0.5, 15), (0.5, 8))
+
+
+class RateController:
+    """
+    Steps a peer's frame size and rate down when the receiver reports loss
+    or a long round trip, and back up after `upgrade_after` clean seconds.
+    Scaling the frames before they reach the encoder works the same for
+    every codec aiortc negotiates, in hardware or software.
+    """
+
+    def __init__(
+        self, max_loss: float = 0.05, max_rtt: float = 0.3, upgrade_after: float = 5.0
+    ):
+        self.max_loss = max_loss
+        self.max_rtt = max_rtt
+        self.upgrade_after = upgrade_after
+        self.level = 0
+        self.changed = 0.0
+
+    @property
+    def quality(self):
+        return QUALITY_LEVELS[self.level]
+
+    def update(self, loss: float, rtt: float, now: float):
+        if loss > self.max_loss or rtt > self.max_rtt:
+            if self.level < len(QUALITY_LEVELS) - 1 and now - self.changed >= 1.0:
+                self.level += 1
+                self.changed = now
+        elif self.level > 0 and now - self.changed >= self.upgrade_after:
+            self.level -= 1
+            self.changed = now
+
+
+class AnnotatedTrack(VideoStreamTrack):
+    """Annotated frames from the shared pipeline, sized and paced per peer."""
+
+    def __init__(self, pipeline: TrackerPipeline, rate: RateController):
+        super().__init__()
+        self.pipeline = pipeline
+        self.rate = rate
+        self.frame_id = 0
+        self.started = None
+        self.last_sent = 0.0
+        pipeline.subscribe()
+
+    async def recv(self):
+        scale, max_fps = self.rate.quality
+        wait = self.last_sent + 1 / max_fps - time.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self.frame_id, image = await self.pipeline.next_frame(self.frame_id)
+        now = time.time()
+        if self.started is None:
+            self.started = now
+        self.last_sent = now
+        if scale != 1.0:
+            # The encoders want even dimensions for 4:2:0 chroma
+            h, w = image.shape[:2]
+            size = (int(w * scale) // 2 * 2, int(h * scale) // 2 * 2)
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        frame = VideoFrame.from_ndarray(image, format="bgr24")
+        frame.pts = int((now - self.started) * VIDEO_CLOCK_RATE)
+        frame.time_base = VIDEO_TIME_BASE
+        return frame
+
+    def stop(self):
+        if self.readyState == "live":
+            self.pipeline.unsubscribe()
+        super().stop()
+
+
+async def control_rate(pc: RTCPeerConnection, sender, rate: RateController):
+    # Loss and round trip come from the receiver's RTCP reports
+    while pc.connectionState not in ("closed", "failed"):
+        await asyncio.sleep(1)
+        stats = await sender.getStats()
+        for report in stats.values():
+            if report.type == "remote-inbound-rtp":
+                rtt = report.roundTripTime or 0.0
+                rate.update(report.fractionLost or 0.0, rtt, time.time())
 
 
 async def offer(request):
+    app = request.app
     params = await request.json()
     offer = RTCSessionDescription(sdp=params["sdp"], type=params["type"])
 
+    try:
+        app["capture"].start()
+    except RuntimeError as e:
+        return web.Response(status=500, text=str(e))
+
     pc = RTCPeerConnection()
     pcs.add(pc)
+    pipeline = app["pipeline"]
+    rate = RateController()
+    track = AnnotatedTrack(pipeline, rate)
+
+    @pc.on("datachannel")
+    def on_datachannel(channel):
+        if channel.label != "status":
+            return
+        pipeline.channels.add(channel)
+
+        @channel.on("open")
+        def on_open():
+            channel.send(pipeline.status_message())
+
+        @channel.on("close")
+        def on_close():
+            pipeline.channels.discard(channel)
+
+        if channel.readyState == "open":
+            channel.send(pipeline.status_message())
 
     @pc.on("connectionstatechange")
     async def on_connectionstatechange():
         print("Connection state is:", pc.connectionState)
-        if pc.connectionState == "failed":
+        if pc.connectionState in ("failed", "closed"):
+            track.stop()
             await pc.close()
             pcs.discard(pc)
 
-    options = {
-        "format": "avfoundation",
-        "video_size": "1280x720",
-        "framerate": "30",
-        "pixel_format": "uyvy422",
-    }
-    player = MediaPlayer("default:none", format="avfoundation", options=options)
-
     await pc.setRemoteDescription(offer)
+    sender = None
     for t in pc.getTransceivers():
         if t.kind == "video":
-            pc.addTrack(player.video)
+            sender = pc.addTrack(track)
+    if sender is None:
+        track.stop()
+    else:
+        asyncio.create_task(control_rate(pc, sender, rate))
 
     answer = await pc.createAnswer()
     await pc.setLocalDescription(answer)
@@ -45,39 +292,65 @@ async def offer(request):
 
 
 async def get_webcam_frame(request):
-    # Initialize webcam capture
-    cap = cv2.VideoCapture(0)  # 0 is usually the default webcam
-
-    if not cap.isOpened():
+    # Reuses the shared camera instead of opening it for every request
+    capture = request.app["capture"]
+    try:
+        capture.start()
+    except RuntimeError:
         return web.Response(status=500, text="Failed to open webcam")
 
-    # Capture a single frame
-    ret, frame = cap.read()
-    cap.release()
-
-    if not ret:
+    # The reader thread may not have a frame yet right after opening
+    for _ in range(100):
+        _, frame = capture.latest()
+        if frame is not None:
+            break
+        await asyncio.sleep(0.01)
+    else:
         return web.Response(status=500, text="Failed to capture frame")
 
     # Encode frame as JPEG
-    _, img_encoded = cv2.imencode(".jpg", frame)
+    _, img_encoded = await asyncio.to_thread(cv2.imencode, ".jpg", frame)
 
     # Create response with JPEG image
     response = web.Response(body=img_encoded.tobytes(), content_type="image/jpeg")
     return response
 
 
+async def on_startup(app):
+    # The pipeline's asyncio primitives belong to the server's loop
+    app["pipeline"] = TrackerPipeline(app["capture"], app["weights"], app["confidence"])
+
+
 async def on_shutdown(app):
     # close peer connections
     coros = [pc.close() for pc in pcs]
     await asyncio.gather(*coros)
     pcs.clear()
+    if app["pipeline"].task is not None:
+        app["pipeline"].task.cancel()
+    app["capture"].close()
+
+
+def source_spec(value: str):
+    return int(value) if value.isdigit() else value
 
 
 pcs = set()
 app = web.Application()
+app.on_startup.append(on_startup)
 app.on_shutdown.append(on_shutdown)
 app.router.add_get("/test_webcam", get_webcam_frame)
 app.router.add_post("/offer", offer)
 
 if __name__ == "__main__":
-    web.run_app(app, host="localhost", port=8080)
+    args = argparse.ArgumentParser()
+    args.add_argument("--source", type=source_spec, default=0, help="Camera or video")
+    args.add_argument("--weights", type=str, default="best.pt")
+    args.add_argument("--confidence", type=float, default=0.4)
+    args.add_argument("--host", type=str, default="localhost")
+    args.add_argument("--port", type=int, default=8080)
+    args = args.parse_args()
+    app["capture"] = SharedCapture(args.source)
+    app["weights"] = args.weights
+    app["confidence"] = args.confidence
+    web.run_app(app, host=args.host, port=args.port)